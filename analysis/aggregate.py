@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cache
+import payments
+import thresholds
+
+OUTCOMES = thresholds.OUTCOMES
+
+THRESHOLDS_SUFFIX = 'thresholds.json'
+PAYMENTS_SUFFIX = 'payments.json'
+
+def pull_files(directory, kinds=('thresholds', 'payments')):
+    # Returns the thresholds and payments files in a pull directory as (kind, node, path), where node is the
+    # file's path relative to directory without its suffix (eg, 000001 for 000001_thresholds.json). Thresholds
+    # are only looked for at the top level, like count_dropped always has, and payments anywhere below it.
+    files = []
+    if 'thresholds' in kinds:
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            if filename.endswith(THRESHOLDS_SUFFIX) and os.path.isfile(path):
+                files.append(('thresholds', _node_name(directory, path, THRESHOLDS_SUFFIX), path))
+
+    if 'payments' in kinds:
+        for root, dirs, filenames in os.walk(directory):
+            # Don't descend into the parse cache.
+            dirs[:] = sorted(d for d in dirs if d != cache.CACHE_DIR)
+            for filename in sorted(filenames):
+                if filename.endswith(PAYMENTS_SUFFIX):
+                    path = os.path.join(root, filename)
+                    files.append(('payments', _node_name(directory, path, PAYMENTS_SUFFIX), path))
+
+    return files
+
+def _node_name(directory, path, suffix):
+    name = os.path.relpath(path, directory)[:-len(suffix)].rstrip('_')
+    return name or '.'
+
+def outcome_counts(outcomes):
+    # Counts every htlc outcome in a single pass over the outcome column, in the same columns as
+    # thresholds.channel_outcome_counts.
+    counts = np.bincount(thresholds.outcome_columns(outcomes), minlength=len(OUTCOMES) + 1)
+    return {
+        'htlcs': len(outcomes),
+        **{name: int(counts[outcome + 1]) for outcome, name in OUTCOMES.items()},
+        'unknown': int(counts[0]),
+    }
+
+def status_counts(status):
+    # Counts the final payment statuses in a single pass over the payment_status column.
+    counts = np.bincount(status.astype(np.int64) + 1, minlength=len(payments.PAYMENT_STATUSES) + 1)
+    return {
+        'succeeded': int(counts[payments.PAYMENT_STATUSES.index('SUCCEEDED') + 1]),
+        'failed': int(counts[payments.PAYMENT_STATUSES.index('FAILED') + 1]),
+    }
+
+def count_file(kind, path):
+    # Counts a single file's htlc outcomes or payment statuses. Runs in a worker process, so errors reading a
+    # file (eg, one that's missing, truncated mid-pull or has unexpected records) are returned to be reported,
+    # and the file skipped, rather than raised and losing the counts for every other file.
+    try:
+        if kind == 'thresholds':
+            return outcome_counts(thresholds.load_htlcs(path)['outcome']), None
+
+        return status_counts(payments.load_payments(path)['payment_status']), None
+    except (ValueError, OSError, KeyError, TypeError) as e:
+        return None, str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"
+
+def merge_counts(counters, counts):
+    for name, count in counts.items():
+        counters[name] = counters.get(name, 0) + count
+
+def aggregate(directory, workers=None, kinds=('thresholds', 'payments')):
+    # Counts htlc outcomes and payment statuses across every file in a pull directory using a process pool.
+    # Returns the totals for each kind, a per-node breakdown, and the files that couldn't be parsed.
+    files = pull_files(directory, kinds)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(count_file, [kind for kind, _, _ in files], [path for _, _, path in files]))
+
+    totals = {'thresholds': {}, 'payments': {}}
+    nodes = {}
+    errors = []
+    for (kind, node, path), (counts, error) in zip(files, results):
+        if error is not None:
+            errors.append((path, error))
+            continue
+
+        merge_counts(totals[kind], counts)
+        merge_counts(nodes.setdefault(node, {}), counts)
+
+    return {'totals': totals, 'nodes': nodes, 'errors': errors}
+
+def success_rate(counts):
+    # Returns the percentage of final payments that succeeded, or None if there weren't any.
+    total = counts.get('succeeded', 0) + counts.get('failed', 0)
+    return counts.get('succeeded', 0) * 100 / total if total else None
+
+def print_outcomes(outcomes):
+    print(f"Total HTLCs: {outcomes.get('htlcs', 0)}")
+    print(f"Total HTLCs dropped no resources: {outcomes.get('dropped_no_resources', 0)}")
+    print(f"Total HTLCs forwarded unendorsed: {outcomes.get('forwarded_unendorsed', 0)}")
+    print(f"Total HTLCs forwarded endorsed: {outcomes.get('forwarded_endorsed', 0)}")
+    print(f"Total HTLCs dropped due to unknown outgoing: {outcomes.get('dropped_unknown_outgoing', 0)}")
+
+def print_statuses(statuses):
+    rate = success_rate(statuses)
+    if rate is None:
+        print("No payments found across files.")
+    else:
+        print(f"Total payments across all files: {statuses['succeeded'] + statuses['failed']}")
+        print(f"Succeeded: {statuses['succeeded']}")
+        print(f"Failed: {statuses['failed']}")
+        print(f"Success rate: {rate:.2f}%")
+
+def print_summary(summary, per_node=False):
+    print_outcomes(summary['totals']['thresholds'])
+    print_statuses(summary['totals']['payments'])
+
+    if per_node:
+        for node, counts in sorted(summary['nodes'].items()):
+            rate = success_rate(counts)
+            print(f"{node}: htlcs {counts.get('htlcs', 0)}, "
+                  f"dropped no resources {counts.get('dropped_no_resources', 0)}, "
+                  f"dropped unknown outgoing {counts.get('dropped_unknown_outgoing', 0)}, "
+                  f"payments {counts.get('succeeded', 0) + counts.get('failed', 0)}"
+                  + (f" ({rate:.2f}% succeeded)" if rate is not None else ""))
+
+    for path, error in summary['errors']:
+        print(f"Error reading {path}: {error}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count htlc outcomes and payment statuses across a pull directory.")
+    parser.add_argument("directory")
+    parser.add_argument("--per-node", action="store_true", help="print each node's counts as well as the totals")
+    parser.add_argument("--json", action="store_true", help="print the totals and per-node counts as json")
+    parser.add_argument("--workers", type=int, help="processes to count files with, defaults to the cpu count")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"{args.directory} is not a directory.")
+        sys.exit(1)
+
+    summary = aggregate(args.directory, args.workers)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary, args.per_node)
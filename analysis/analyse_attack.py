@@ -1,16 +1,17 @@
 import time
-import projected_revenue
+import argparse
+import api_client
 from datetime import datetime
 import re
 import subprocess
 import csv
 import json
 import costs
+import forwarding_history
 import tempfile
 import os
+import results
 import sys
-import target_jammed
-import target_liquidity_jammed
 
 lncli_commands = [
     "kubectl exec -it flagship -n warnet-armada -- lncli --network=regtest --tlscertpath=/credentials/lnd0-tls.cert --macaroonpath=/credentials/lnd0-admin.macaroon --rpcserver=lightning-0.warnet-armada",
@@ -21,21 +22,42 @@ lncli_commands = [
 def execute_command_and_save_output(command, filename):
     file_path = os.path.join(os.getcwd(), filename)
     with open(file_path, 'w') as file:
-        subprocess.run(command, stdout=file, shell=True)
+        result = subprocess.run(command, stdout=file, shell=True)
+
+    return result.returncode
+
+def save_api_response(body, filename):
+    with open(filename, 'wb') as file:
+        file.write(body)
+
+    return 0
+
+def save_forwarding_history(node_id, filename, circuitbreaker=None):
+    # If an api_client.CircuitBreakerClient is provided, it's used instead of exec-ing into the node's pod.
+    if circuitbreaker is not None:
+        return save_api_response(circuitbreaker.forwarding_history(), filename)
 
-def save_forwarding_history(node_id, filename):
     command = f"kubectl -n warnet exec -it warnet-tank-ln-{node_id} -c ln-cb -- wget -qO- http://localhost:9235/api/forwarding_history"
-    execute_command_and_save_output(command, filename)
+    return execute_command_and_save_output(command, filename)
+
+def save_thresholds(node_id, filename, circuitbreaker=None):
+    if circuitbreaker is not None:
+        return save_api_response(circuitbreaker.reputation_thresholds(), filename)
 
-def save_thresholds(node_id, filename):
     command = f"kubectl -n warnet exec -it warnet-tank-ln-{node_id} -c ln-cb -- wget -qO- http://localhost:9235/api/reputation_thresholds"
-    execute_command_and_save_output(command, filename)
+    return execute_command_and_save_output(command, filename)
+
+def save_channel_list(node_id, filename, lnd=None):
+    if lnd is not None:
+        return save_api_response(json.dumps(lnd.list_channels()).encode('utf-8'), filename)
 
-def save_channel_list(node_id, filename):
     command = f"warcli lncli {node_id} listchannels"
     execute_command_and_save_output(command, filename)
 
-def get_pubkey(node_id):
+def get_pubkey(node_id, lnd=None):
+    if lnd is not None:
+        return lnd.getinfo().get("identity_pubkey", None)
+
     command = f"warcli lncli {node_id} getinfo"
     
     try:
@@ -70,20 +92,33 @@ def simln_start_time():
         raise ValueError("Started time not found in the pod description: {pod_description}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python analyse_attack.py <network_name> [attack_runtime_ns]")
-        sys.exit(1)
-    network_name = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Analyse an attack against the target node of a network.")
+    parser.add_argument("network_name")
+    parser.add_argument("end_time", type=int, nargs="?", help="end of the attack in unix ns, defaults to now")
+    parser.add_argument("--endpoints", help="json file with LND/circuitbreaker API endpoints to use instead of kubectl (see api_client.load_endpoints)")
+    parser.add_argument("--start", type=int, help="start of the attack in unix ns, defaults to when the sim-ln pod started")
+    args = parser.parse_args()
+    network_name = args.network_name
 
     # If an end time was provided, use it. Otherwise we'll use the current time as an end time.
-    if len(sys.argv) > 2:
-        end_time = sys.argv[2]
+    if args.end_time is not None:
+        end_time = args.end_time
     else:
         end_time = time.time_ns()
 
+    # If API endpoints are provided, we talk to the nodes directly over pooled connections rather than starting
+    # a kubectl process for every call.
+    endpoints = api_client.load_endpoints(args.endpoints) if args.endpoints else {}
+    target_lnd = endpoints.get('target_lnd')
+    target_circuitbreaker = endpoints.get('target_circuitbreaker')
+    attackers = endpoints.get('attackers') or lncli_commands
+    if args.endpoints and not endpoints.get('attackers'):
+        print(f"No attackers in {args.endpoints}, pulling their payments with lncli")
+
     # Use the time that sim-ln started as our start time, this is when payments would have started
-    # to flow through the network.
-    start_time = simln_start_time()
+    # to flow through the network. Sim-ln doesn't have an API that we could ask, so unless a start time is
+    # provided we read it from its pod's description, even when we're using API endpoints.
+    start_time = args.start if args.start is not None else simln_start_time()
     print(f"Running analysis for period: {start_time} -> {end_time}")
 
     # Construct the file path
@@ -99,64 +134,30 @@ if __name__ == "__main__":
 
     padded_node_id = node_id.zfill(6)   
 
+    # Circuitbreaker returns the full history on every call, but we only append forwards that are new since the
+    # last run so that cached analysis of the history can be updated rather than rebuilt.
     fwd_file = "forwarding_history.json"
-    save_forwarding_history(padded_node_id, fwd_file)
-
-    channel_file = "channels.json"
-    save_channel_list(padded_node_id, "channels.json")
-
-    threshold_file = "thresholds.json"
-    save_thresholds(padded_node_id, threshold_file)
-    
-    target_pubkey = get_pubkey(node_id)
-
-    total_payment_count = 0
-    attacker_success_msat = 0
-    attacker_unconditional_msat = 0
-
-    target_total = 0
-    attacker_to_target_success_msat = 0
-    attacker_to_target_uncond_msat = 0
-
-    for i, command in enumerate(lncli_commands):
-        attacker_costs = costs.get_attacker_costs('lnd_'+str(i)+'.json', command, target_pubkey, start_time, end_time)
-        total_payment_count += attacker_costs['attacker_total']
-        attacker_success_msat += attacker_costs['attacker_success_msat']
-        attacker_unconditional_msat += attacker_costs['attacker_unconditional_msat']
-
-        attacker_to_target_success_msat += attacker_costs['target_success_msat']
-        attacker_to_target_uncond_msat += attacker_costs['target_unconditional_msat']
-
-    attacker_total = attacker_success_msat + attacker_unconditional_msat
-    print()
-    print(f"Attacker sent: {total_payment_count} payments paying {attacker_total} msat fees")
-    print(f"- Success fees: {attacker_success_msat} msat")
-    print(f"- Unconditional fees: {attacker_unconditional_msat} msat\n")
-
-    mean_revenue, std_dev = projected_revenue.get_revenue_stats(network_name, node_id, end_time-start_time)
-    print(f"Target revenue without attack: {mean_revenue} msat (standard deviation: {std_dev}")
-
-    success_revenue, unconditional_revenue = costs.get_target_revenue(fwd_file, start_time, end_time)
-    target_revenue = success_revenue + unconditional_revenue
-    honest_revenue = target_revenue - attacker_to_target_uncond_msat - attacker_to_target_success_msat
-
-    print(f"Target revenue under attack: {target_revenue} msat")
-    print(f"- Success Fees: {success_revenue} msat")
-    print(f"- Unconditional fees: {unconditional_revenue} msat\n")
-
-    attacker_to_target_total = attacker_to_target_success_msat + attacker_to_target_uncond_msat
-    attacker_to_target_percent = round(attacker_to_target_total * 100 / target_revenue, 2)
-    honest_to_target_percent = round(honest_revenue * 100 / target_revenue, 2)
-    print("Breakdown of target's revenue under attack:")
-    print(f"- Attacker paid {attacker_to_target_percent}%: {attacker_to_target_total} msat")
-    print(f"- Honest traffic paid {honest_to_target_percent}%: {honest_revenue} msat\n")
-
-    jam_time = target_jammed.get_jam_time(fwd_file, 440)
-    print(f"Total amount slot jammed > 440 slots: {jam_time} minutes")
-
-    liquidity_jam_time = target_liquidity_jammed.is_liquidity_jammed(channel_file, fwd_file, 0.9)
-    print(f"Total amount liquidity jammed > 90%: {liquidity_jam_time} minutes\n")
-
-    print("Result CSV:")
-    print("attacker_success_msat,attacker_unconditional_msat,target_success_msat,target_unconditional_msat,attacker_to_target_msat,jam_time_min,liquidity_jam_time")
-    print(f"{attacker_success_msat},{attacker_unconditional_msat},{success_revenue},{unconditional_revenue},{attacker_to_target_total},{jam_time},{liquidity_jam_time}")
+    fwd_download = f"{fwd_file}.download"
+    if save_forwarding_history(padded_node_id, fwd_download, target_circuitbreaker) != 0:
+        print(f"Failed to pull forwarding history for node {node_id}.")
+        sys.exit(1)
+    forwarding_history.append_forwarding_history(fwd_download, fwd_file)
+    os.remove(fwd_download)
+
+    save_channel_list(padded_node_id, "channels.json", target_lnd)
+    save_thresholds(padded_node_id, "thresholds.json", target_circuitbreaker)
+
+    target_pubkey = get_pubkey(node_id, target_lnd)
+
+    # Costs are computed page by page while the attackers' payments are pulled, so they're handed to the
+    # analysis rather than re-read from the files.
+    attacker_files = ['lnd_'+str(i)+'.json' for i in range(len(attackers))]
+    attacker_costs = [
+        costs.get_attacker_costs(file_name, command, target_pubkey, start_time, end_time)
+        for file_name, command in zip(attacker_files, attackers)
+    ]
+
+    analysis = results.Results(".", start_time, end_time, target_pubkey, network_name, node_id)
+    analysis.provide('attacker_files', attacker_files)
+    analysis.provide('attacker_costs', attacker_costs)
+    results.print_report(analysis, analysis.run())
@@ -0,0 +1,148 @@
+import http.client
+import json
+import ssl
+import threading
+from urllib.parse import urlencode, urlsplit
+
+class HttpTransport:
+    # Makes GET requests over pooled keep-alive connections, so that repeated calls to the same host don't pay
+    # for a new connection (or TLS handshake) each time. Any object with the same get method can be used as a
+    # transport by the clients below, eg to route requests to a local stand-in server in tests.
+    def __init__(self, timeout=60, max_idle_per_host=8):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _connect(self, scheme, netloc, ssl_context):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout, context=ssl_context)
+
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _checkout(self, key, ssl_context):
+        with self.lock:
+            connections = self.idle.get(key, [])
+            if connections:
+                return connections.pop(), True
+
+        return self._connect(key[0], key[1], ssl_context), False
+
+    def _checkin(self, key, connection):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+
+        connection.close()
+
+    def get(self, url, headers=None, ssl_context=None):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        connection, reused = self._checkout(key, ssl_context)
+        try:
+            connection.request('GET', path, headers=headers or {})
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.RemoteDisconnected, ConnectionError):
+            connection.close()
+
+            # An idle connection may have been closed by the server, so retry once on a fresh one.
+            if not reused:
+                raise
+            connection = self._connect(parts.scheme, parts.netloc, ssl_context)
+            connection.request('GET', path, headers=headers or {})
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        if response.status != 200:
+            raise RuntimeError(f"GET {url} failed with {response.status}: {body.decode('utf-8', 'replace')}")
+
+        return body
+
+class LndClient:
+    # Talks to LND's REST API directly, rather than through lncli in a pod.
+    def __init__(self, url, macaroon_path, tls_cert_path=None, transport=None):
+        self.url = url.rstrip('/')
+        self.transport = transport or HttpTransport()
+
+        with open(macaroon_path, 'rb') as f:
+            self.headers = {'Grpc-Metadata-macaroon': f.read().hex()}
+
+        self.ssl_context = None
+        if tls_cert_path is not None:
+            # LND's certificate is self-signed, so we trust it directly rather than checking its hostname (which
+            # won't match if we're reaching the node through a port forward).
+            self.ssl_context = ssl.create_default_context(cafile=tls_cert_path)
+            self.ssl_context.check_hostname = False
+
+    def get_json(self, path, params=None):
+        url = f"{self.url}{path}" + (f"?{urlencode(params)}" if params else "")
+        return json.loads(self.transport.get(url, self.headers, self.ssl_context))
+
+    def getinfo(self):
+        return self.get_json('/v1/getinfo')
+
+    def list_channels(self):
+        return self.get_json('/v1/channels')
+
+    def list_payments(self, index_offset=0, max_payments=10000, reversed=False):
+        # Pages forwards from index_offset, or if reversed, backwards from it (from the newest payment if it's 0).
+        params = {
+            'include_incomplete': 'true',
+            'index_offset': index_offset,
+            'max_payments': max_payments,
+        }
+        if reversed:
+            params['reversed'] = 'true'
+
+        return self.get_json('/v1/payments', params)
+
+class CircuitBreakerClient:
+    # Talks to circuitbreaker's HTTP API directly, rather than through wget in its container.
+    def __init__(self, url, transport=None):
+        self.url = url.rstrip('/')
+        self.transport = transport or HttpTransport()
+
+    def forwarding_history(self):
+        return self.transport.get(f"{self.url}/api/forwarding_history")
+
+    def reputation_thresholds(self):
+        return self.transport.get(f"{self.url}/api/reputation_thresholds")
+
+def load_endpoints(file_path, transport=None):
+    # Creates clients from an endpoints file that sets out where to reach the target and attacking nodes, eg:
+    # {
+    #   "target": {
+    #     "lnd": {"url": "https://localhost:8080", "macaroon": "admin.macaroon", "tls_cert": "tls.cert"},
+    #     "circuitbreaker": "http://localhost:9235"
+    #   },
+    #   "attackers": [
+    #     {"url": "https://localhost:8081", "macaroon": "lnd0-admin.macaroon", "tls_cert": "lnd0-tls.cert"}
+    #   ]
+    # }
+    # All clients share one transport, so connections are pooled across them.
+    with open(file_path, 'r') as f:
+        endpoints = json.load(f)
+
+    transport = transport or HttpTransport()
+
+    def lnd_client(config):
+        return LndClient(config['url'], config['macaroon'], config.get('tls_cert'), transport)
+
+    return {
+        'target_lnd': lnd_client(endpoints['target']['lnd']),
+        'target_circuitbreaker': CircuitBreakerClient(endpoints['target']['circuitbreaker'], transport),
+        'attackers': [lnd_client(config) for config in endpoints.get('attackers', [])],
+    }
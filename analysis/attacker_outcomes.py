@@ -1,73 +1,38 @@
 import json
 import sys
 import matplotlib.pyplot as plt
-import datetime
+import numpy as np
+import outcome_plots
+import thresholds
 
 def channel_reputation(file_path, scid):
-    timestamps = []
-    outcomes = []
+    # Returns the forward timestamps (in ns) and outcome levels of the htlcs forwarded over scid.
+    try:
+        index = thresholds.load_channel_index(file_path)
+    except json.JSONDecodeError as e:
+        print(f"Error reading {file_path}: {e}")
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
 
-    with open(file_path, 'r') as file:
-        try:
-            data = json.load(file)
-            htlcs = data.get('htlcs', [])
-            
-            for htlc in htlcs:
-                if htlc.get('outgoingChannel') == scid:
-                    timestamp_ns = int(htlc.get('forwardTsNs', 0))
-                    outcome = int(htlc.get('outcome', 0))
-
-                    # Add the timestamp for this forward and its outcome
-                    timestamp = datetime.datetime.fromtimestamp(timestamp_ns / 1e9)
-                    timestamps.append(timestamp)
-
-                    # The values that we use for outcomes don't map nicely to a visual
-                    # representation (eg, values 0 and 3 both represent a dropped value).
-                    # To be able to graph them nicely, we re-assign values.
-                    # forward endorsed 2 -> 0
-                    # forward unendorsed 1 -> 1
-                    # drop no resources 0 -> 2
-                    # drop low rep 3 -> 3
-                    if outcome == 2:
-                            outcomes.append(0)
-                    elif outcome == 1:
-                            outcomes.append(1)
-                    elif outcome == 0:
-                            outcomes.append(2)
-                    elif outcome == 3:
-                            outcomes.append(3)
-
-        except json.JSONDecodeError as e:
-            print(f"Error reading {file_path}: {e}")
-
-    return timestamps, outcomes
+    channel_data = outcome_plots.channel_series(index, scids=[int(scid)])
+    return channel_data.get(int(scid), (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)))
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python attacker_outcomes.py target_threshold_path short_channel_id")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python attacker_outcomes.py target_threshold_path short_channel_id [output.png]")
         sys.exit(1)
 
     target_threshold = sys.argv[1]
     scid = sys.argv[2]
 
     timestamps, outcomes = channel_reputation(target_threshold, scid)
+    series = outcome_plots.thin_series("Forwards: Target -> Attacker", timestamps, outcomes)
 
-    plt.figure(figsize=(10, 5))
-    plt.plot(timestamps, outcomes, marker='s', label="Outcome", color='green', linestyle='--')
-
-    # Add titles and labels
-    plt.title("Forwards: Target -> Attacker")
-    plt.xlabel("Timestamp")
-
-    # Rotate the x-axis labels for better readability
-    plt.xticks(rotation=45)
-
-    plt.yticks([0, 1, 2, 3], [
-        "Endorsed Forward",
-        "Unendorsed Forward",
-        "No Resource Dropped",
-        "Low Reputation Dropped"
-    ])
+    # With an output path the graph is rendered headless, otherwise it's shown.
+    if len(sys.argv) == 4:
+        outcome_plots.render_channel(*series, sys.argv[3])
+        sys.exit(0)
 
+    plt.figure(figsize=(10, 5))
+    outcome_plots.draw_outcomes(plt.gca(), *series)
     plt.tight_layout()
     plt.show()
@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import aggregate
+import cache
+import costs
+import payments
+import success_rate
+import synthetic_data
+import target_jammed
+import target_liquidity_jammed
+
+# Each metric is run against a directory written by synthetic_data.generate, and described by synthetic.json.
+# The modules that they use are imported above rather than in each metric, so that the one-off cost of importing
+# them (and pandas) isn't included in the metric's wall time.
+def _target_revenue(directory, description):
+    return costs.get_target_revenue(os.path.join(directory, 'forwarding_history.json'),
+                                    description['start_time_ns'], description['end_time_ns'])
+
+def _attacker_costs(directory, description):
+    tables = payments.load_payments(os.path.join(directory, 'payments.json'))
+    return payments.attacker_costs(tables, description['target_pubkey'], description['start_time_ns'],
+                                   description['end_time_ns'])
+
+def _slot_jam_time(directory, description):
+    return target_jammed.get_jam_time(os.path.join(directory, 'forwarding_history.json'), 440)
+
+def _liquidity_jam_time(directory, description):
+    return target_liquidity_jammed.is_liquidity_jammed(os.path.join(directory, 'channels.json'),
+                                                       os.path.join(directory, 'forwarding_history.json'), 0.9)
+
+def _count_dropped(directory, description):
+    # count_dropped is a script, so we run it as one. Its only import, aggregate, is already loaded.
+    argv = sys.argv
+    sys.argv = ['count_dropped.py', directory]
+    try:
+        runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'count_dropped.py'),
+                       run_name='__main__')
+    finally:
+        sys.argv = argv
+
+def _success_rate(directory, description):
+    success_rate.calculate_success_rate(directory)
+
+METRICS = {
+    'target_revenue': _target_revenue,
+    'attacker_costs': _attacker_costs,
+    'slot_jam_time': _slot_jam_time,
+    'liquidity_jam_time': _liquidity_jam_time,
+    'count_dropped': _count_dropped,
+    'success_rate': _success_rate,
+}
+
+RESULT_FIELDS = ['metric', 'forwards', 'channels', 'cache', 'wall_secs', 'peak_rss_mb']
+
+def peak_rss_mb():
+    # Metrics that count files in a process pool do their work in child processes, so we report the larger of
+    # this process' peak and the largest peak of its (finished) children. ru_maxrss is reported in kilobytes on
+    # Linux and bytes on macOS.
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+def measure(metric, directory):
+    # Runs a single metric in this process, printing its wall time and peak RSS as json. Metric
+    # output is discarded so that it doesn't get mixed up with the measurement.
+    with open(os.path.join(directory, 'synthetic.json'), 'r') as file:
+        description = json.load(file)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        METRICS[metric](directory, description)
+        wall_secs = time.perf_counter() - start
+
+    print(json.dumps({'wall_secs': wall_secs, 'peak_rss_mb': peak_rss_mb()}))
+
+def run_metric(metric, directory):
+    # Each measurement runs in a fresh interpreter so that peak RSS isn't carried over between metrics.
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', metric, directory],
+                            stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode('utf-8').strip().splitlines()[-1])
+
+def run_benchmarks(forward_sizes, channel_sizes, metrics, directory, seed=0):
+    # Generates data for every combination of sizes and yields a result row per metric. Each metric is run once
+    # with an empty parse cache (cold), then again with the cache that the first run built (warm).
+    for forward_count, channel_count in itertools.product(forward_sizes, channel_sizes):
+        data_dir = os.path.join(directory, f"{forward_count}_{channel_count}")
+        print(f"Generating {forward_count} forwards over {channel_count} channels", file=sys.stderr)
+        synthetic_data.generate(data_dir, forward_count, channel_count, seed=seed)
+
+        for metric in metrics:
+            shutil.rmtree(cache.cache_dir(data_dir), ignore_errors=True)
+            for cache_state in ['cold', 'warm']:
+                result = run_metric(metric, data_dir)
+                yield {
+                    'metric': metric,
+                    'forwards': forward_count,
+                    'channels': channel_count,
+                    'cache': cache_state,
+                    'wall_secs': round(result['wall_secs'], 4),
+                    'peak_rss_mb': round(result['peak_rss_mb'], 1),
+                }
+
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis metrics against synthetic data.")
+    parser.add_argument("--forwards", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--channels", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--metrics", nargs="+", choices=list(METRICS), default=list(METRICS))
+    parser.add_argument("--output", help="csv file to write results to, as well as printing them")
+    parser.add_argument("--data-dir", help="directory to generate data in, defaults to a temporary directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--measure", nargs=2, metavar=("METRIC", "DIRECTORY"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        sys.exit(0)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="attackathon-benchmark-")
+    output = open(args.output, 'w', newline='') if args.output else None
+    try:
+        writers = [csv.DictWriter(sys.stdout, fieldnames=RESULT_FIELDS)]
+        if output:
+            writers.append(csv.DictWriter(output, fieldnames=RESULT_FIELDS))
+
+        for writer in writers:
+            writer.writeheader()
+
+        for row in run_benchmarks(args.forwards, args.channels, args.metrics, data_dir, args.seed):
+            for writer in writers:
+                writer.writerow(row)
+            sys.stdout.flush()
+    finally:
+        if output:
+            output.close()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# Parsed artifacts are cached in a directory next to the file that they were read from. For read-only or shared
+# results directories, ANALYSIS_CACHE_DIR can be set to keep the cache somewhere else instead, with a directory
+# in it for each directory that files are read from.
+CACHE_DIR = '.analysis_cache'
+CACHE_DIR_ENV = 'ANALYSIS_CACHE_DIR'
+
+def source_key(source_path):
+    stat = os.stat(source_path)
+    return {
+        'source': os.path.abspath(source_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+def cache_dir(directory):
+    # Returns the directory that cache entries for files in directory are kept in.
+    directory = os.path.abspath(directory)
+    override = os.environ.get(CACHE_DIR_ENV)
+    if override:
+        return os.path.join(override, hashlib.sha1(directory.encode('utf-8')).hexdigest()[:16])
+
+    return os.path.join(directory, CACHE_DIR)
+
+def writable(source_path):
+    # Returns whether cache entries can be written for source_path. If not, files are read without the cache.
+    root = cache_dir(os.path.dirname(os.path.abspath(source_path)))
+    try:
+        os.makedirs(root, exist_ok=True)
+    except OSError:
+        return False
+
+    return os.access(root, os.W_OK)
+
+def _entry_path(source_path, kind):
+    directory, name = os.path.split(os.path.abspath(source_path))
+    return os.path.join(cache_dir(directory), f"{name}.{kind}")
+
+def _read_meta(entry):
+    try:
+        with open(os.path.join(entry, 'meta.json'), 'r') as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _map_columns(entry, meta):
+    columns = {}
+    for name, column in meta['columns'].items():
+        dtype = np.dtype(column['dtype'])
+        if column['length'] == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(os.path.join(entry, f"{name}.bin"), dtype=dtype, mode='r',
+                                      shape=(column['length'],))
+    return columns
+
+def lookup(source_path, kind):
+    # Returns memory-mapped columns for source_path if we have a cache entry for the file at its current size
+    # and modification time, otherwise None.
+    entry = _entry_path(source_path, kind)
+    meta = _read_meta(entry)
+    if meta is None or meta['key'] != source_key(source_path):
+        return None
+
+    return _map_columns(entry, meta)
+
+def cached_batches(source_path, kind, read_batches):
+    # Yields batches of columns for source_path. If the file is already cached, the cached columns are yielded
+    # as a single memory-mapped batch. Otherwise batches are read with read_batches(source_path) and appended
+    # to a new cache entry as they're yielded, so building the cache doesn't need the whole file in memory. If
+    # the cache can't be written, batches are yielded as they're read without being cached.
+    columns = lookup(source_path, kind)
+    if columns is not None:
+        yield columns
+        return
+
+    if not writable(source_path):
+        yield from read_batches(source_path)
+        return
+
+    key = source_key(source_path)
+    entry = _entry_path(source_path, kind)
+    tmp_entry = f"{entry}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_entry, ignore_errors=True)
+    os.makedirs(tmp_entry)
+
+    meta = {'key': key, 'columns': {}}
+    try:
+        for batch in read_batches(source_path):
+            for name, values in batch.items():
+                values = np.ascontiguousarray(values)
+                column = meta['columns'].setdefault(name, {'dtype': values.dtype.str, 'length': 0})
+                with open(os.path.join(tmp_entry, f"{name}.bin"), 'ab') as file:
+                    file.write(values.astype(column['dtype'], copy=False).tobytes())
+                column['length'] += len(values)
+
+            yield batch
+
+        with open(os.path.join(tmp_entry, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+
+        # Swap the finished entry in, replacing any stale entry for an older version of the file.
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp_entry, entry)
+    finally:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+def load_columns(source_path, kind, read_batches):
+    # Returns memory-mapped columns for source_path, parsing it with read_batches and caching the result the
+    # first time that it's read. If the cache can't be written, the batches are concatenated in memory instead.
+    if lookup(source_path, kind) is None and not writable(source_path):
+        return _concatenate(read_batches(source_path))
+
+    for _ in cached_batches(source_path, kind, read_batches):
+        pass
+
+    columns = lookup(source_path, kind)
+    if columns is None:
+        raise ValueError(f"{source_path} changed while it was being cached")
+
+    return columns
+
+def _concatenate(batches):
+    columns = {}
+    for batch in batches:
+        for name, values in batch.items():
+            columns.setdefault(name, []).append(np.asarray(values))
+
+    return {name: np.concatenate(values) for name, values in columns.items()}
+
+def replace_rows(source_path, kind, previous_key, keep_rows, batch):
+    # Updates the cache entry for source_path after the rows following its first keep_rows rows were replaced
+    # by batch in the file itself, so that we don't need to re-parse the whole file. This is only possible if
+    # the entry was current for the file before it was modified (previous_key), otherwise it'll be rebuilt on
+    # the next read. Returns whether the entry was updated.
+    entry = _entry_path(source_path, kind)
+    meta = _read_meta(entry)
+    if meta is None or meta['key'] != previous_key or set(meta['columns']) != set(batch):
+        return False
+
+    for name, column in meta['columns'].items():
+        dtype = np.dtype(column['dtype'])
+        with open(os.path.join(entry, f"{name}.bin"), 'ab') as file:
+            file.truncate(keep_rows * dtype.itemsize)
+            file.write(np.ascontiguousarray(batch[name], dtype=dtype).tobytes())
+        column['length'] = keep_rows + len(batch[name])
+
+    meta['key'] = source_key(source_path)
+    tmp_meta = os.path.join(entry, f"meta.json.tmp-{os.getpid()}")
+    with open(tmp_meta, 'w') as file:
+        json.dump(meta, file)
+    os.replace(tmp_meta, os.path.join(entry, 'meta.json'))
+
+    return True
@@ -2,125 +2,318 @@ import subprocess
 import json
 import pandas as pd
 import argparse
+import os
+import re
+import time
+import forwarding_history
+import payments as payments_tables
 
-def run_lncli_command(command):
-    result = subprocess.run(
-        command.split(),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    if result.returncode != 0:
-        print(f"Error running command {command}: {result.stderr.decode('utf-8')}")
-        return None
-    
-    return json.loads(result.stdout.decode('utf-8'))
-
-def get_target_revenue(forwarding_hist_file, start_time_ns, end_time_ns):
-    with open(forwarding_hist_file, 'r') as file:
-        data = json.load(file)
-        
+def get_target_revenue(forwarding_hist, start_time_ns, end_time_ns):
     success_fee_msat = 0
     unconditional_fee_msat = 0
 
-    for forward in data['forwards']:
+    for forwards in forwarding_history.forward_batches(forwarding_hist):
         # If incoming/ outgoing match, it's bootstrapped
-        htlcIn = forward['incomingCircuit']['htlcIndex']
-        htlcOut = forward['outgoingCircuit']['htlcIndex']
-        if htlcIn == htlcOut and int(htlcIn) > 4294967295:
-            continue
+        htlc_in = forwards['incoming_htlc_index']
+        bootstrapped = (htlc_in == forwards['outgoing_htlc_index']) & (htlc_in > 4294967295)
 
-        resolveTime = int(forward['resolveTimeNs'])
-        if resolveTime < start_time_ns:
-            continue
+        resolve_time = forwards['resolve_time']
+        in_period = (resolve_time >= start_time_ns) & (resolve_time <= end_time_ns)
 
-        if resolveTime > end_time_ns:
-            continue
-        
-        incoming_amount = int(forward['incomingAmount'])
-        outgoing_amount = int(forward['outgoingAmount'])
-        fee_msat = incoming_amount - outgoing_amount
+        fee_msat = (forwards['incoming_amount'] - forwards['outgoing_amount'])[~bootstrapped & in_period]
+        settled = forwards['settled'][~bootstrapped & in_period]
 
-        if forward['settled']:
-            success_fee_msat += fee_msat
+        success_fee_msat += int(fee_msat[settled].sum())
+        unconditional_fee_msat += int(fee_msat.sum())
 
-        unconditional_fee_msat += fee_msat * 0.01
+    return success_fee_msat, unconditional_fee_msat * 0.01
 
-    return success_fee_msat, unconditional_fee_msat
+# Bounds for adaptive pagination: page sizes are grown or shrunk so that each listpayments call takes around
+# PAGE_TARGET_SECS.
+PAGE_TARGET_SECS = 2.0
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100000
+
+LAST_INDEX_OFFSET = re.compile(rb'"last_index_offset"\s*:\s*"?(\d+)"?')
+
+def start_listpayments(command, index_offset, max_payments):
+    return subprocess.Popen(
+        f"{command} listpayments --include_incomplete --paginate_forwards --index_offset={index_offset} --max_payments={max_payments}".split(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    ), time.monotonic()
+
+def next_page_size(page_size, elapsed_secs):
+    if elapsed_secs < PAGE_TARGET_SECS / 2:
+        return min(page_size * 2, MAX_PAGE_SIZE)
+
+    if elapsed_secs > PAGE_TARGET_SECS * 2:
+        return max(page_size // 2, MIN_PAGE_SIZE)
+
+    return page_size
+
+def iter_lncli_payment_pages(command, max_payments_per_call=10, adaptive=True, index_offset=0):
+    # Yields pages of payments from lncli listpayments, starting after index_offset. The next page is requested
+    # as soon as the current page's last_index_offset is known, so that it's in flight while we decode the
+    # current page and while the caller processes it. If adaptive is set, max_payments_per_call is only the
+    # first page size, and later pages are sized based on how long the last call took.
+    page_size = max_payments_per_call
+    process, started = start_listpayments(command, index_offset, page_size)
+
+    try:
+        while process is not None:
+            stdout, stderr = process.communicate()
+            elapsed_secs = time.monotonic() - started
+            requested = page_size
+
+            # Raise rather than stopping early, so that callers don't save state for a pull that didn't finish.
+            if process.returncode != 0:
+                raise RuntimeError(f"Error running command {command}: {stderr.decode('utf-8')}")
+
+            # Pull the offset for the next page out of the raw output (it's at the end of the response) so that
+            # we can start the next call before decoding this page.
+            offset_at = stdout.rfind(b'"last_index_offset"')
+            match = LAST_INDEX_OFFSET.match(stdout, offset_at) if offset_at >= 0 else None
+
+            if adaptive:
+                page_size = next_page_size(page_size, elapsed_secs)
+
+            process = None
+            if match is not None:
+                process, started = start_listpayments(command, int(match.group(1)), page_size)
+
+            payments = json.loads(stdout.decode('utf-8')).get('payments', [])
+            yield payments
+
+            if len(payments) < requested:
+                return
+    finally:
+        # Stop any page that we requested ahead if we didn't need it.
+        if process is not None:
+            process.kill()
+            process.wait()
+
+def iter_api_payment_pages(client, max_payments_per_call=10, adaptive=True, index_offset=0):
+    # Yields pages of payments from an api_client.LndClient, sized in the same way as iter_lncli_payment_pages.
+    # Requests reuse a pooled connection, so there's no process to start for each page.
+    page_size = max_payments_per_call
 
-def paginate_lncli_listpayments(command, max_payments_per_call=10):
-    index_offset = 0
-    all_payments = []
-    
     while True:
-        response = run_lncli_command(f"{command} listpayments --include_incomplete --paginate_forwards --index_offset={index_offset} --max_payments={max_payments_per_call}")
+        started = time.monotonic()
+        response = client.list_payments(index_offset, page_size)
+        elapsed_secs = time.monotonic() - started
 
-        if response is None:
-            break
-        
         payments = response.get('payments', [])
+        yield payments
+
+        if len(payments) < page_size:
+            return
+
+        index_offset = int(response.get('last_index_offset', 0))
+        if adaptive:
+            page_size = next_page_size(page_size, elapsed_secs)
+
+def payment_pages(source, max_payments_per_call=10, index_offset=0):
+    # Payments can be pulled with an lncli command or with an api_client.LndClient.
+    if isinstance(source, str):
+        return iter_lncli_payment_pages(source, max_payments_per_call, index_offset=index_offset)
+
+    return iter_api_payment_pages(source, max_payments_per_call, index_offset=index_offset)
+
+def paginate_lncli_listpayments(command, max_payments_per_call=10):
+    all_payments = []
+    for payments in iter_lncli_payment_pages(command, max_payments_per_call):
         all_payments.extend(payments)
 
-        last_index_offset = response.get('last_index_offset', 0)
-        num_payments_returned = len(payments)
-        
-        if num_payments_returned < max_payments_per_call:
-            break
-        
-        # Prepare for the next call
-        index_offset = last_index_offset
-    
     return all_payments
 
+# Payments in these states won't change, so an incremental pull can resume after them.
+FINAL_PAYMENT_STATUSES = ('SUCCEEDED', 'FAILED')
 
-def process_attacker_payments(payments, target_pubkey, start_time_ns, end_time_ns):
-    results = []
-
-    attacker_total = 0
-    attacker_success_msat = 0
-    attacker_unconditional_msat = 0
-
-    target_total = 0
-    target_success_msat = 0
-    target_unconditional_msat = 0
-
-    for payment in payments:
-        creation_time_ns = int(payment.get("creation_time_ns", 0))
-        if start_time_ns <= creation_time_ns <= end_time_ns:
-            attacker_total += 1
-            for htlc in payment["htlcs"]:
-                    attacker_total += 1
-                    success = htlc["status"] == "SUCCEEDED"
-                
-                    route_fee = int(htlc["route"]["total_fees_msat"])
-                    attacker_unconditional_msat += route_fee
-                
-                    if success:
-                        attacker_success_msat += route_fee
-
-                    for hop in htlc["route"]["hops"]:
-                        if hop["pub_key"] == target_pubkey:
-                            target_total += 1
-                            hop_fee_msat = int(hop["fee_msat"])
-
-                            target_unconditional_msat += hop_fee_msat
-                            if success:
-                                target_success_msat += hop_fee_msat
+def payment_state_path(file_name):
+    return f"{file_name}.state.json"
+
+def new_payment_state():
+    return {
+        # Index offset and position in the file just after the last payment that we've written which was
+        # final, along with every payment before it.
+        'index_offset': 0,
+        'file_offset': None,
+        'final_count': 0,
+        'max_creation_time_ns': 0,
+        # The node that the payments are from, and its first payment, which identify the run that they're from.
+        'node': None,
+        'first_payment': None,
+    }
+
+def _run_command(command):
+    process = subprocess.run(command.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError(f"Error running command {command}: {process.stderr.decode('utf-8')}")
+
+    return json.loads(process.stdout.decode('utf-8'))
+
+def _single_payment(source, newest):
+    # Returns the node's first (or newest) payment, or None if it hasn't made any.
+    if isinstance(source, str):
+        # lncli pages backwards from the newest payment unless it's asked to paginate forwards.
+        paginate = "" if newest else " --paginate_forwards"
+        response = _run_command(f"{source} listpayments --include_incomplete{paginate} --index_offset=0 --max_payments=1")
+    else:
+        response = source.list_payments(0, 1, reversed=newest)
+
+    payments = response.get('payments', [])
+    return payments[0] if payments else None
+
+def payment_run(source):
+    # Identifies the run of the node behind source (an lncli command or an api_client.LndClient): its pubkey,
+    # its first payment and the index of its newest payment. A node that's recreated for a new run has a new
+    # first payment and restarts its payment indexes.
+    info = _run_command(f"{source} getinfo") if isinstance(source, str) else source.getinfo()
+    first = _single_payment(source, newest=False)
+    newest = _single_payment(source, newest=True)
 
     return {
-        'attacker_total': attacker_total,
-        'attacker_success_msat': attacker_success_msat,
-        'attacker_unconditional_msat': attacker_unconditional_msat * 0.01,
-        'target_total': target_total,
-        'target_success_msat': target_success_msat,
-        'target_unconditional_msat': target_unconditional_msat * 0.01,
+        'node': info.get('identity_pubkey'),
+        'first_payment': [first.get('payment_hash'), int(first.get('creation_time_ns', 0))] if first else None,
+        'newest_index': int(newest.get('payment_index', 0)) if newest else 0,
     }
 
+def load_payment_state(file_name, source=None):
+    # Loads the state saved by the last pull into file_name, or returns a fresh state if there isn't one (or
+    # the payments file that it describes has gone). If source is given, the state is also checked against the
+    # node's current run, and a fresh state is returned if it's from a different node or run, or is past the
+    # node's newest payment, so that pulls and costs don't carry over from an earlier run.
+    state = _saved_payment_state(file_name)
+    if source is None:
+        return state
+
+    run = payment_run(source)
+    if state['file_offset'] is not None and (
+            state.get('node') != run['node'] or
+            state.get('first_payment') not in (None, run['first_payment']) or
+            state['index_offset'] > run['newest_index']):
+        print(f"Payments in {file_name} are from a different run of {run['node']}, pulling them again")
+        state = new_payment_state()
+
+    state['node'] = run['node']
+    state['first_payment'] = state.get('first_payment') or run['first_payment']
+    return state
+
+def _saved_payment_state(file_name):
+    try:
+        with open(payment_state_path(file_name), 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return new_payment_state()
+
+    if not os.path.exists(file_name) or os.path.getsize(file_name) < state['file_offset']:
+        return new_payment_state()
+
+    return state
+
+def save_payment_state(file_name, state):
+    with open(payment_state_path(file_name), 'w') as f:
+        json.dump(state, f)
+
+def read_final_payments(file_name, state):
+    # Reads back the payments that were final as of the last pull, which are written one per line.
+    if state['file_offset'] is None:
+        return []
+
+    with open(file_name, 'rb') as f:
+        lines = f.read(state['file_offset']).split(b'\n')[1:]
+
+    return [json.loads(line.rstrip(b',')) for line in lines if line.strip()]
+
+def write_payment_pages(pages, file_name, state):
+    # Writes pages of payments to file_name as {"payments": [...]}, one payment per line, as they're produced.
+    # If state is from an earlier pull into the same file, everything after its last final payment is replaced
+    # by the new pages, which should start after state's index_offset. The state is updated as payments are
+    # written and should be saved by the caller once the pages have been consumed.
+    #
+    # Yields each page along with the number of payments at the start of it that are newly final, so that
+    # callers can process payments while they're written without accumulating them in memory.
+    with open(file_name, 'r+b' if state['file_offset'] is not None else 'wb') as f:
+        if state['file_offset'] is None:
+            f.write(b'{"payments": [')
+            state['file_offset'] = f.tell()
+        else:
+            f.seek(state['file_offset'])
+            f.truncate()
+
+        written = state['final_count'] > 0
+        pending = False
+
+        for payments in pages:
+            final = 0
+            for payment in payments:
+                f.write((b',\n' if written else b'\n') + json.dumps(payment).encode('utf-8'))
+                written = True
+
+                # Once we reach a payment that could still change, everything after it has to be fetched again
+                # on the next pull.
+                if pending or payment.get('status') not in FINAL_PAYMENT_STATUSES or 'payment_index' not in payment:
+                    pending = True
+                    continue
+
+                final += 1
+                state['index_offset'] = int(payment['payment_index'])
+                state['file_offset'] = f.tell()
+                state['final_count'] += 1
+                state['max_creation_time_ns'] = max(state['max_creation_time_ns'], int(payment.get('creation_time_ns', 0)))
+
+            yield payments, final
+
+        f.write(b'\n]}\n')
+
+def pull_payments(command, file_name, state, max_payments_per_call=10000):
+    # Fetches the payments that are new since state was saved and writes them to file_name. The command can be
+    # an lncli command or an api_client.LndClient.
+    pages = payment_pages(command, max_payments_per_call, state['index_offset'])
+    return write_payment_pages(pages, file_name, state)
+
+def process_attacker_payments(payments, target_pubkey, start_time_ns, end_time_ns):
+    # Flattens the payments into columnar htlc and hop tables once, with pubkeys interned as ids, so that fee
+    # totals are masked sums rather than nested loops over every hop.
+    return payments_tables.attacker_costs(payments_tables.flatten_payments(payments), target_pubkey,
+                                          start_time_ns, end_time_ns)
+
+def add_costs(total_costs, costs):
+    for key, value in costs.items():
+        total_costs[key] += value
+
 def get_attacker_costs(file_name, command, target_pubkey, start_time_ns, end_time_ns, max_payments_per_call=10000):
-    result = paginate_lncli_listpayments(command, max_payments_per_call)
-   
-    # Write to json file so that we can re-run if necessary.
-    with open(file_name, 'w') as f:
-        json.dump({"payments": result}, f, indent=4)
+    state = load_payment_state(file_name, command)
+
+    # Costs for payments that were already final at the last pull are saved with its state. We can reuse them if
+    # the target and start time are the same, and both the old and new end time are after every final payment
+    # (so that the time window selects the same payments).
+    saved_costs = state.get('costs')
+    if saved_costs is not None and \
+            saved_costs['target_pubkey'] == target_pubkey and \
+            saved_costs['start_time_ns'] == start_time_ns and \
+            min(saved_costs['end_time_ns'], end_time_ns) >= state['max_creation_time_ns']:
+        final_costs = saved_costs['totals']
+    else:
+        final_costs = process_attacker_payments(read_final_payments(file_name, state), target_pubkey, start_time_ns, end_time_ns)
+
+    # Costs are summed over payments, so we only need to process the new payments that we pull, page by page.
+    # Everything is written to a json file so that we can re-run if necessary.
+    pending_costs = process_attacker_payments([], target_pubkey, start_time_ns, end_time_ns)
+    for payments, final in pull_payments(command, file_name, state, max_payments_per_call):
+        add_costs(final_costs, process_attacker_payments(payments[:final], target_pubkey, start_time_ns, end_time_ns))
+        add_costs(pending_costs, process_attacker_payments(payments[final:], target_pubkey, start_time_ns, end_time_ns))
+
+    state['costs'] = {
+        'target_pubkey': target_pubkey,
+        'start_time_ns': start_time_ns,
+        'end_time_ns': end_time_ns,
+        'totals': final_costs,
+    }
+    save_payment_state(file_name, state)
+
+    total_costs = dict(final_costs)
+    add_costs(total_costs, pending_costs)
 
-    return process_attacker_payments(result, target_pubkey, start_time_ns, end_time_ns)
+    return total_costs
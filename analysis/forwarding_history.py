@@ -0,0 +1,341 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import cache
+
+# Columns produced for each batch of forwards, and the dtype that they're stored with. HTLC indexes for
+# bootstrapped forwards sit above the uint32 range so they're kept unsigned.
+FORWARD_COLUMNS = {
+    'add_time': np.int64,
+    'resolve_time': np.int64,
+    'resolved': bool,
+    'incoming_amount': np.int64,
+    'outgoing_amount': np.int64,
+    'incoming_scid': np.int64,
+    'outgoing_scid': np.int64,
+    'incoming_htlc_index': np.uint64,
+    'outgoing_htlc_index': np.uint64,
+    'settled': bool,
+}
+
+FORWARDS_START = re.compile(r'"forwards"\s*:\s*\[')
+
+def _forward_row(entry):
+    resolve_time = entry.get('resolveTimeNs')
+
+    return (
+        int(entry['addTimeNs']),
+        int(resolve_time) if resolve_time is not None else 0,
+        resolve_time is not None,
+        int(entry['incomingAmount']),
+        int(entry['outgoingAmount']),
+        int(entry['incomingCircuit']['shortChannelId']),
+        int(entry['outgoingCircuit']['shortChannelId']),
+        int(entry['incomingCircuit']['htlcIndex']),
+        int(entry['outgoingCircuit']['htlcIndex']),
+        bool(entry.get('settled', False)),
+    )
+
+def _to_batch(rows):
+    columns = list(zip(*rows)) if rows else [[] for _ in FORWARD_COLUMNS]
+    return {
+        name: np.array(values, dtype=dtype)
+        for (name, dtype), values in zip(FORWARD_COLUMNS.items(), columns)
+    }
+
+def iter_forward_entries(file, read_size, missing_ok=True):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+
+    def fill():
+        nonlocal buffer, eof
+        chunk = file.read(read_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+    # Find the start of the forwards array. Keep enough of the tail around that we don't miss a key that's
+    # split across reads.
+    while True:
+        match = FORWARDS_START.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if eof:
+            if missing_ok:
+                return
+            raise ValueError("No forwards array in forwarding history")
+        buffer = buffer[-64:]
+        fill()
+
+    pos = 0
+    while True:
+        # Skip over whitespace and separators between entries.
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of file in forwards array")
+            buffer = ''
+            pos = 0
+            fill()
+            continue
+
+        if buffer[pos] == ']':
+            return
+
+        try:
+            entry, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely we've only read part of this entry, so read more and try again.
+            if eof:
+                raise
+            buffer = buffer[pos:]
+            pos = 0
+            fill()
+            continue
+
+        yield entry
+        pos = end
+
+def read_forward_batches(file_path, batch_size=100000, read_size=1 << 20):
+    # Incrementally reads the forwards array of circuitbreaker's forwarding_history.json, yielding batches of
+    # up to batch_size forwards as a dict of numpy columns (see FORWARD_COLUMNS). Only the current batch and
+    # a read buffer are held in memory, rather than the whole decoded file.
+    rows = []
+    yielded = False
+
+    with open(file_path, 'r') as file:
+        for entry in iter_forward_entries(file, read_size):
+            if not isinstance(entry, dict):
+                print(f"Expected a dictionary but got {type(entry)}.")
+                continue
+
+            rows.append(_forward_row(entry))
+            if len(rows) == batch_size:
+                yield _to_batch(rows)
+                yielded = True
+                rows = []
+
+    # Always yield at least one batch so that an empty history still has all of its columns.
+    if rows or not yielded:
+        yield _to_batch(rows)
+
+def concat_batches(batches):
+    # Joins batches from read_forward_batches into a single set of columns.
+    batches = list(batches)
+    if not batches:
+        return _to_batch([])
+
+    # A single batch (eg, a memory-mapped cache hit) doesn't need to be copied.
+    if len(batches) == 1:
+        return batches[0]
+
+    return {name: np.concatenate([batch[name] for batch in batches]) for name in FORWARD_COLUMNS}
+
+def cached_forward_batches(file_path, batch_size=100000):
+    # Reads forwarding history through the on-disk cache: the first read parses the JSON (caching its columns
+    # as it goes) and later reads of the unchanged file are memory-mapped from the cache.
+    return cache.cached_batches(file_path, 'forwards', lambda path: read_forward_batches(path, batch_size))
+
+def load_forwards(file_path, batch_size=100000):
+    return concat_batches(cached_forward_batches(file_path, batch_size))
+
+# Columns of the pair schedule as a DataFrame (see EventSchedule.to_frame), and the forward column that each
+# one is taken from.
+SCHEDULE_COLUMNS = {
+    'addTimeNs': 'add_time',
+    'resolveTimeNs': 'resolve_time',
+    'incomingAmount': 'incoming_amount',
+    'outgoingAmount': 'outgoing_amount',
+    'shortChannelId_outgoing': 'outgoing_scid',
+    'shortChannelId_incoming': 'incoming_scid',
+}
+
+class EventSchedule:
+    # The pair schedule of add and resolve events for a set of forwards. Events don't copy their forward's
+    # fields: each event is the index of its forward and whether it's the add or the resolve, so a schedule
+    # costs 5 bytes per event (9 past 2^31 forwards) on top of the forward columns, which may be memory-mapped
+    # from the cache. Per-event columns are gathered from the forwards when they're asked for.
+    __slots__ = ('forwards', 'forward_idx', 'is_add')
+
+    def __init__(self, forwards, forward_idx, is_add):
+        self.forwards = forwards
+        self.forward_idx = forward_idx
+        self.is_add = is_add
+
+    def __len__(self):
+        return len(self.forward_idx)
+
+    def column(self, name):
+        # Returns a forward column (see FORWARD_COLUMNS) for each event.
+        return self.forwards[name][self.forward_idx]
+
+    @property
+    def event_time(self):
+        return np.where(self.is_add, self.column('add_time'), self.column('resolve_time'))
+
+    @property
+    def sign(self):
+        # +1 for adds and -1 for resolves, for summing the slots or liquidity that each event takes or frees.
+        return np.where(self.is_add, 1, -1)
+
+    def select(self, mask):
+        # Returns the schedule of the events selected by mask, in the same order.
+        return EventSchedule(self.forwards, self.forward_idx[mask], self.is_add[mask])
+
+    def to_frame(self, columns=None):
+        # Materializes the schedule as a DataFrame with a row per event, for callers that want one.
+        columns = columns or ['addTimeNs', 'resolveTimeNs', 'eventTimeNs', 'eventType', 'incomingAmount',
+                              'outgoingAmount', 'shortChannelId_outgoing', 'shortChannelId_incoming']
+
+        frame = {}
+        for name in columns:
+            if name == 'eventTimeNs':
+                frame[name] = self.event_time
+            elif name == 'eventType':
+                frame[name] = pd.Categorical.from_codes(np.where(self.is_add, 0, 1), ['add', 'resolve'])
+            else:
+                frame[name] = self.column(SCHEDULE_COLUMNS[name])
+
+        return pd.DataFrame(frame, columns=columns)
+
+def event_schedule(forwards):
+    # Creates the pair schedule of add and resolve events for a set of forwards: one add event per forward,
+    # and one resolve event for each forward that has resolved, sorted by event time. Ties keep a forward's
+    # add ahead of its resolve, and earlier forwards ahead of later ones.
+    count = len(forwards['add_time'])
+    resolved = np.flatnonzero(forwards['resolved'])
+    index_dtype = np.int32 if count < 2 ** 31 else np.int64
+
+    forward_idx = np.concatenate([np.arange(count, dtype=index_dtype), resolved.astype(index_dtype)])
+    is_add = np.concatenate([np.ones(count, dtype=bool), np.zeros(len(resolved), dtype=bool)])
+    event_time = np.concatenate([forwards['add_time'], forwards['resolve_time'][resolved]])
+
+    order = np.lexsort((~is_add, forward_idx, event_time))
+    del event_time
+
+    return EventSchedule(forwards, forward_idx[order], is_add[order])
+
+def load_history(file_path):
+    # Parses forwarding history and builds its sorted event schedule once, so that a single load can be shared
+    # between the revenue, slot jamming and liquidity jamming metrics.
+    forwards = load_forwards(file_path)
+    return {'forwards': forwards, 'schedule': event_schedule(forwards)}
+
+def forward_batches(history):
+    # Metrics accept either a path to forwarding_history.json, which is streamed in batches, or a history that
+    # has already been loaded with load_history.
+    if isinstance(history, dict):
+        yield history['forwards']
+    else:
+        yield from cached_forward_batches(history)
+
+def pair_schedule(history):
+    if isinstance(history, dict):
+        return history['schedule']
+
+    return event_schedule(load_forwards(history))
+
+def history_state_path(file_name):
+    return f"{file_name}.state.json"
+
+def load_history_state(file_name):
+    try:
+        with open(history_state_path(file_name), 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = None
+
+    if state is None or not os.path.exists(file_name) or os.path.getsize(file_name) < state['file_offset']:
+        return {'file_offset': None, 'resolved_count': 0, 'last_resolve_time_ns': 0, 'run': None}
+
+    state.setdefault('run', None)
+
+    return state
+
+def _run_key(entry):
+    # Identifies a forward across pulls, for telling which run a forwarding history is from.
+    return [int(entry['addTimeNs']), int(entry['incomingCircuit']['shortChannelId']),
+            int(entry['incomingCircuit']['htlcIndex'])]
+
+def append_forwarding_history(download_path, file_name):
+    # Merges a fresh download of circuitbreaker's forwarding history into file_name, which is kept as
+    # {"forwards": [...]} with one forward per line: every resolved forward from earlier pulls, followed by any
+    # forwards that haven't resolved yet. Only forwards that have resolved since the last pull are appended,
+    # unresolved forwards are rewritten on every pull. If file_name's columns are cached, the cache entry is
+    # updated with just the new forwards rather than rebuilt.
+    #
+    # The history's run is identified by its earliest forward, which stays the same for as long as the run's
+    # history grows. Returns the number of newly resolved and unresolved forwards written. Raises ValueError,
+    # rather than touching file_name, if the download isn't a forwarding history, is from a different run than
+    # file_name or has fewer resolved forwards than it.
+    state = load_history_state(file_name)
+    previous_key = cache.source_key(file_name) if state['file_offset'] is not None else None
+
+    resolved, unresolved = [], []
+    resolved_count = 0
+    run = None
+    with open(download_path, 'r') as download:
+        for entry in iter_forward_entries(download, 1 << 20, missing_ok=False):
+            if not isinstance(entry, dict):
+                continue
+
+            key = _run_key(entry)
+            if run is None or key < run:
+                run = key
+
+            if 'resolveTimeNs' not in entry:
+                unresolved.append(entry)
+                continue
+
+            resolved_count += 1
+            if int(entry['resolveTimeNs']) > state['last_resolve_time_ns']:
+                resolved.append(entry)
+
+    if state['run'] is not None and run != state['run']:
+        raise ValueError(f"Forwarding history in {download_path} is from a different run than {file_name}, its "
+                         f"earliest forward is {run} rather than {state['run']}. Remove {file_name} to start over.")
+
+    # Forwarding history only grows, so if the download has fewer resolved forwards than we've already stored
+    # then it's from a different run (or a partial download). We don't know which, so leave it to the caller
+    # rather than losing the stored history.
+    if resolved_count < state['resolved_count']:
+        raise ValueError(f"Forwarding history in {download_path} has {resolved_count} resolved forwards, fewer "
+                         f"than the {state['resolved_count']} in {file_name}. Remove {file_name} to start over.")
+
+    with open(file_name, 'r+b' if state['file_offset'] is not None else 'wb') as f:
+        if state['file_offset'] is None:
+            f.write(b'{"forwards": [')
+            state['file_offset'] = f.tell()
+        else:
+            f.seek(state['file_offset'])
+            f.truncate()
+
+        written = state['resolved_count'] > 0
+        for entry in resolved + unresolved:
+            f.write((b',\n' if written else b'\n') + json.dumps(entry).encode('utf-8'))
+            written = True
+
+            if 'resolveTimeNs' in entry:
+                state['file_offset'] = f.tell()
+                state['last_resolve_time_ns'] = max(state['last_resolve_time_ns'], int(entry['resolveTimeNs']))
+
+        f.write(b'\n]}\n')
+
+    keep_rows = state['resolved_count']
+    state['resolved_count'] += len(resolved)
+    state['run'] = run
+
+    if previous_key is not None:
+        cache.replace_rows(file_name, 'forwards', previous_key, keep_rows,
+                           _to_batch([_forward_row(entry) for entry in resolved + unresolved]))
+
+    with open(history_state_path(file_name), 'w') as f:
+        json.dump(state, f)
+
+    return len(resolved), len(unresolved)
@@ -0,0 +1,29 @@
+import sys
+import forwarding_history
+import target_jammed
+import target_liquidity_jammed
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python jam_sweep.py forwarding_history_file channels_file [output_prefix]")
+        sys.exit(1)
+
+    forwarding_history_file = sys.argv[1]
+    channels_file = sys.argv[2]
+
+    # Parse the history once and share its schedule between both sweeps.
+    fwd_history = forwarding_history.load_history(forwarding_history_file)
+
+    slot_curve = target_jammed.slot_jam_curve(fwd_history)
+    liquidity_curve = target_liquidity_jammed.liquidity_jam_curve(channels_file, fwd_history)
+
+    # Optionally write the full curves to <output_prefix>_slots.csv and <output_prefix>_liquidity.csv.
+    if len(sys.argv) == 4:
+        slot_curve.to_csv(f"{sys.argv[3]}_slots.csv", index=False)
+        liquidity_curve.to_csv(f"{sys.argv[3]}_liquidity.csv", index=False)
+
+    print("Jam time (minutes) by slot threshold:")
+    print(slot_curve.iloc[::20].to_string(index=False))
+    print()
+    print("Jam time (minutes) by liquidity ratio:")
+    print(liquidity_curve.to_string(index=False))
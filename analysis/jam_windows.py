@@ -0,0 +1,160 @@
+import sys
+import numpy as np
+import pandas as pd
+import forwarding_history
+import target_jammed
+import target_liquidity_jammed
+
+WINDOW_COLUMNS = ['criterion', 'channel', 'direction', 'start', 'end', 'duration_minutes', 'open']
+
+# The attackathon's goal is to jam the target for an hour.
+GOAL_MINUTES = 60
+
+def _windows(groups, above):
+    # Finds the continuous periods where above holds within each group of a timeline that's sorted by group then
+    # time. Returns the first and last row of each period.
+    first_in_group = np.ones(len(groups), dtype=bool)
+    first_in_group[1:] = groups[1:] != groups[:-1]
+    last_in_group = np.ones(len(groups), dtype=bool)
+    last_in_group[:-1] = first_in_group[1:]
+
+    was_above = np.concatenate([[False], above[:-1]]) & ~first_in_group
+    stays_above = np.concatenate([above[1:], [False]]) & ~last_in_group
+
+    starts = np.flatnonzero(above & ~was_above)
+    ends = np.flatnonzero(above & ~stays_above)
+
+    return starts, ends
+
+def observation_end(schedule, end_time=None):
+    # Returns the time that windows which are still running are observed until: end_time if it's given (eg, the
+    # end of the attack), otherwise the schedule's last event. Both criteria use the same end, so that a channel
+    # that's fully jammed (and so has no further events of its own) is still counted as jammed until then.
+    if end_time is not None:
+        return int(end_time)
+
+    times = schedule.event_time
+    return int(times.max()) if len(times) else 0
+
+def _window_frame(criterion, channels, directions, start_times, end_times, still_open):
+    return pd.DataFrame({
+        'criterion': criterion,
+        'channel': channels,
+        'direction': directions,
+        'start': start_times,
+        'end': end_times,
+        'duration_minutes': (end_times - start_times) / (1e9 * 60),
+        'open': still_open,
+    }, columns=WINDOW_COLUMNS)
+
+def slot_windows(schedule, lower_bound=440, end_time=None):
+    # Returns every continuous period where a channel had at least lower_bound slots taken. A period ends at the
+    # event that took the channel back below lower_bound. Periods that are still running end at
+    # observation_end(schedule, end_time) and are marked open.
+    timelines = target_jammed.process_all_channels(schedule)
+    channels = timelines['channel'].to_numpy()
+    times = timelines['time'].to_numpy(dtype=np.int64)
+    above = timelines['taken_slots'].to_numpy() >= lower_bound
+
+    starts, ends = _windows(channels, above)
+
+    # The event after a period's last row is the one that ends it, unless that row is the channel's last event.
+    next_row = np.minimum(ends + 1, len(times) - 1)
+    still_open = (ends == len(times) - 1) | (channels[next_row] != channels[ends])
+    end_times = np.where(still_open, np.maximum(observation_end(schedule, end_time), times[starts]), times[next_row])
+
+    return _window_frame('slots', channels[starts], 'both', times[starts], end_times, still_open)
+
+def liquidity_windows(schedule, channels_df, liq_jam_ratio=0.9, end_time=None):
+    # Returns every continuous period where a channel had more than liq_jam_ratio of half of its capacity locked
+    # in one direction. Unlike calculate_active_time, which spans each event to its forward's resolve time,
+    # periods here run for as long as the locked amount stays above the limit. Periods that are still running end
+    # at observation_end(schedule, end_time) and are marked open.
+    events = target_liquidity_jammed._schedule_arrays(schedule)
+    chan_ids = channels_df['chan_id'].to_numpy(dtype=np.int64)
+    capacities = channels_df['capacity'].to_numpy(dtype=np.int64)
+    limits = liq_jam_ratio * (capacities // 2)
+    event_count = len(events['time'])
+    last_time = observation_end(schedule, end_time)
+
+    frames = []
+    for direction in ['incoming', 'outgoing']:
+        scids, deltas = events[direction]
+        positions, run_start, run_end, locked = target_liquidity_jammed._locked_runs(
+            scids, deltas, chan_ids, event_count)
+
+        above = locked > limits[positions]
+        starts, ends = _windows(positions, above)
+
+        start_times = events['time'][run_start[starts]]
+        still_open = run_end[ends] == event_count
+        end_times = np.where(still_open, np.maximum(last_time, start_times),
+                             events['time'][np.minimum(run_end[ends], event_count - 1)])
+
+        frames.append(_window_frame('liquidity', chan_ids[positions[starts]], direction,
+                                    start_times, end_times, still_open))
+
+    return pd.concat(frames, ignore_index=True)
+
+def jam_windows(forwarding_history_file, channels_file, lower_bound=440, liq_jam_ratio=0.9, end_time=None):
+    # Returns the slot and liquidity jam windows of every channel, sorted by start time. Windows that are still
+    # running are observed until end_time, or the last event in the history if it isn't given.
+    schedule = forwarding_history.pair_schedule(forwarding_history_file)
+    channels_df = target_liquidity_jammed.create_channels_df(channels_file)
+
+    return schedule_windows(schedule, channels_df, lower_bound, liq_jam_ratio, end_time)
+
+def schedule_windows(schedule, channels_df, lower_bound=440, liq_jam_ratio=0.9, end_time=None):
+    # jam_windows for a schedule and channel list that have already been loaded.
+    end_time = observation_end(schedule, end_time)
+    windows = pd.concat([
+        slot_windows(schedule, lower_bound, end_time),
+        liquidity_windows(schedule, channels_df, liq_jam_ratio, end_time),
+    ], ignore_index=True)
+
+    return windows.sort_values(['start', 'criterion'], kind='stable').reset_index(drop=True)
+
+def summarize_windows(windows, min_minutes=GOAL_MINUTES):
+    # Reports the longest window, every window of at least min_minutes, and the earliest time that any window
+    # had been running for min_minutes (None if none did).
+    if windows.empty:
+        return {'longest': None, 'long_windows': windows, 'goal_met_ns': None}
+
+    long_windows = windows[windows['duration_minutes'] >= min_minutes]
+    goal_met_ns = None
+    if not long_windows.empty:
+        goal_met_ns = int((long_windows['start'] + int(min_minutes * 60 * 1e9)).min())
+
+    return {
+        'longest': windows.loc[windows['duration_minutes'].idxmax()],
+        'long_windows': long_windows,
+        'goal_met_ns': goal_met_ns,
+    }
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python jam_windows.py forwarding_history_file channels_file [min_minutes]")
+        sys.exit(1)
+
+    forwarding_history_file = sys.argv[1]
+    channels_file = sys.argv[2]
+    min_minutes = float(sys.argv[3]) if len(sys.argv) == 4 else GOAL_MINUTES
+
+    summary = summarize_windows(jam_windows(forwarding_history_file, channels_file), min_minutes)
+
+    longest = summary['longest']
+    if longest is None:
+        print("No channels were jammed")
+        sys.exit(0)
+
+    print(f"Longest continuous jam: {longest['duration_minutes']} minutes ({longest['criterion']} on channel "
+          f"{longest['channel']} {longest['direction']}, from {longest['start']} to {longest['end']})")
+
+    print(f"Windows of at least {min_minutes} minutes: {len(summary['long_windows'])}")
+    if not summary['long_windows'].empty:
+        print(summary['long_windows'].to_string(index=False))
+
+    if summary['goal_met_ns'] is not None:
+        print(f"Jammed for {min_minutes} minutes at: {summary['goal_met_ns']}")
+    else:
+        print(f"Never jammed for {min_minutes} minutes")
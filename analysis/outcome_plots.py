@@ -0,0 +1,173 @@
+import argparse
+import base64
+import html
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+import thresholds
+
+# The values that we use for outcomes don't map nicely to a visual representation (eg, values 0 and 3 both
+# represent a dropped value). To be able to graph them nicely, we re-assign values:
+# forward endorsed 2 -> 0
+# forward unendorsed 1 -> 1
+# drop no resources 0 -> 2
+# drop low rep 3 -> 3
+OUTCOME_LEVELS = np.array([2, 1, 0, 3], dtype=np.int8)
+
+LEVEL_LABELS = [
+    "Endorsed Forward",
+    "Unendorsed Forward",
+    "No Resource Dropped",
+    "Low Reputation Dropped",
+]
+
+# Points drawn for a single channel. Dense series are thinned down to about this many, but every change of
+# outcome is always drawn.
+MAX_POINTS = 5000
+
+def channel_series(index, scids=None, skip_scid=None, start_ns=None, end_ns=None):
+    # Returns {scid: (forward_ts, levels)} for the outgoing channels in a thresholds.load_channel_index index,
+    # in scid order with each channel's htlcs in forward time order, optionally limited to the htlcs forwarded
+    # from start_ns to end_ns. Htlcs without an outcome are treated as outcome 0, and htlcs with an outcome that
+    # isn't in OUTCOME_LEVELS aren't plotted.
+    channels = index['outgoing_channels'] if scids is None else np.asarray(scids, dtype=np.int64)
+
+    channel_data = {}
+    for scid in channels:
+        if skip_scid is not None and scid == int(skip_scid):
+            continue
+
+        forward_ts, outcome = thresholds.channel_htlcs(index, scid, 'outgoing', start_ns, end_ns)
+        outcome = np.where(outcome == -1, 0, outcome)
+        known = (outcome >= 0) & (outcome < len(OUTCOME_LEVELS))
+        if known.any():
+            channel_data[int(scid)] = (np.asarray(forward_ts)[known], OUTCOME_LEVELS[outcome[known]])
+
+    return channel_data
+
+def downsample(times, levels, max_points=MAX_POINTS):
+    # Thins a series to roughly max_points while keeping its shape: the first and last point of every run of
+    # the same outcome are always kept, so every transition is drawn, and any remaining budget is spread
+    # evenly across the series. Returns the indices of the points to keep.
+    count = len(levels)
+    if count <= max_points:
+        return np.arange(count)
+
+    change = np.flatnonzero(levels[1:] != levels[:-1])
+    keep = np.concatenate([[0, count - 1], change, change + 1])
+
+    spare = max_points - len(keep)
+    if spare > 0:
+        keep = np.concatenate([keep, np.linspace(0, count - 1, spare).astype(np.int64)])
+
+    return np.unique(keep)
+
+def thin_series(title, times, levels, max_points=MAX_POINTS):
+    # Downsamples a channel's series before it's drawn (or sent to a worker process), noting in its title if
+    # any points were dropped.
+    keep = downsample(times, levels, max_points)
+    if len(keep) < len(levels):
+        title = f"{title} ({len(keep)} of {len(levels)} htlcs shown)"
+
+    return title, np.asarray(times)[keep], np.asarray(levels)[keep]
+
+def draw_outcomes(ax, title, times, levels):
+    ax.plot(times.astype('datetime64[ns]'), levels, marker='s', label="Outcome", color='green', linestyle='--')
+
+    # Add titles and labels
+    ax.set_title(title)
+    ax.set_xlabel("Timestamp")
+    ax.set_ylabel("Outcome")
+
+    # Rotate the x-axis labels for better readability
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.set_yticks(range(len(LEVEL_LABELS)), LEVEL_LABELS)
+
+def render_channel(title, times, levels, output):
+    # Renders a single (thinned) channel series to output, a path or file object. Figures are created directly
+    # rather than through pyplot so that rendering doesn't need a display and can run in worker processes.
+    figure = Figure(figsize=(10, 5))
+    draw_outcomes(figure.subplots(), title, times, levels)
+    figure.tight_layout()
+    figure.savefig(output, format='png')
+    return output
+
+def _render_png(series):
+    buffer = io.BytesIO()
+    render_channel(*series, buffer)
+    return buffer.getvalue()
+
+def _render_file(task):
+    series, path = task
+    return render_channel(*series, path)
+
+def _thinned(channel_data, max_points):
+    return [thin_series(f"Forward Decisions for Channel {scid}", times, levels, max_points)
+            for scid, (times, levels) in channel_data.items()]
+
+def save_graphs(channel_data, output_dir='.', workers=None, max_points=MAX_POINTS):
+    # Writes {scid}.png for every channel, rendering channels in parallel. Returns the paths written.
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, f"{scid}.png") for scid in channel_data]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_file, zip(_thinned(channel_data, max_points), paths)))
+
+def write_summary(channel_data, path, workers=None, max_points=MAX_POINTS):
+    # Writes every channel to a single file. An .html path gets one image per channel (rendered in parallel)
+    # along with its outcome counts, anything else (eg, .png or .pdf) gets one figure with a panel per channel.
+    series = _thinned(channel_data, max_points)
+
+    if path.endswith('.html'):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            images = list(executor.map(_render_png, series))
+
+        with open(path, 'w') as file:
+            file.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Forward Decisions</title></head><body>\n")
+            for (scid, (_, levels)), image in zip(channel_data.items(), images):
+                counts = np.bincount(levels, minlength=len(LEVEL_LABELS))
+                summary = ", ".join(f"{label}: {count}" for label, count in zip(LEVEL_LABELS, counts))
+                file.write(f"<h2>Channel {scid}</h2>\n<p>{html.escape(summary)}</p>\n")
+                file.write(f"<img src=\"data:image/png;base64,{base64.b64encode(image).decode('ascii')}\">\n")
+            file.write("</body></html>\n")
+        return path
+
+    figure = Figure(figsize=(10, 4 * max(len(series), 1)))
+    axes = figure.subplots(max(len(series), 1), 1, squeeze=False)[:, 0]
+    for ax, channel_series in zip(axes, series):
+        draw_outcomes(ax, *channel_series)
+    figure.tight_layout()
+    figure.savefig(path)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot the forwarding decisions of a target's outgoing channels.")
+    parser.add_argument("threshold_file")
+    parser.add_argument("--scids", type=int, nargs="+", help="only plot these outgoing channels")
+    parser.add_argument("--skip-scid", type=int, help="don't plot this outgoing channel (eg, the attacker's)")
+    parser.add_argument("--output-dir", default=".", help="directory to write a png per channel to")
+    parser.add_argument("--summary", help="write every channel to this single .html, .png or .pdf file instead")
+    parser.add_argument("--start", type=int, help="only plot htlcs forwarded from this time, in unix ns")
+    parser.add_argument("--end", type=int, help="only plot htlcs forwarded up to this time, in unix ns")
+    parser.add_argument("--counts", action="store_true", help="print each outgoing channel's outcome counts instead of plotting")
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS, help="most points to draw for a channel")
+    parser.add_argument("--workers", type=int, help="processes to render with, defaults to the cpu count")
+    args = parser.parse_args()
+
+    index = thresholds.load_channel_index(args.threshold_file)
+    if args.counts:
+        print(thresholds.channel_outcome_counts(index).to_string(index=False))
+        sys.exit(0)
+
+    channel_data = channel_series(index, args.scids, args.skip_scid, args.start, args.end)
+    if not channel_data:
+        print("No htlcs to plot.")
+        sys.exit(1)
+
+    if args.summary:
+        print(f"Wrote {write_summary(channel_data, args.summary, args.workers, args.max_points)}")
+    else:
+        print(f"Wrote {len(save_graphs(channel_data, args.output_dir, args.workers, args.max_points))} graphs to {args.output_dir}")
@@ -0,0 +1,154 @@
+import json
+import numpy as np
+import cache
+
+# Statuses are stored as their index in these lists, or -1 if they're unknown.
+PAYMENT_STATUSES = ['UNKNOWN', 'IN_FLIGHT', 'SUCCEEDED', 'FAILED', 'INITIATED']
+HTLC_STATUSES = ['IN_FLIGHT', 'SUCCEEDED', 'FAILED']
+
+def _status_code(statuses, status):
+    return statuses.index(status) if status in statuses else -1
+
+def flatten_payments(payments):
+    # Flattens lncli listpayments output into three columnar tables that reference each other by index:
+    # - payment_*: one row per payment.
+    # - htlc_*: one row per htlc, with htlc_payment the index of its payment.
+    # - hop_*: one row per hop in each htlc's route, with hop_htlc the index of its htlc.
+    # Hop pubkeys are interned, with hop_pubkey indexing into pubkeys.
+    pubkey_ids = {}
+
+    payment_creation_time, payment_status = [], []
+    htlc_payment, htlc_status, htlc_fee_msat = [], [], []
+    hop_htlc, hop_pubkey, hop_fee_msat = [], [], []
+
+    for payment in payments:
+        payment_index = len(payment_creation_time)
+        payment_creation_time.append(int(payment.get("creation_time_ns", 0)))
+        payment_status.append(_status_code(PAYMENT_STATUSES, payment.get("status")))
+
+        for htlc in payment.get("htlcs", []):
+            htlc_index = len(htlc_payment)
+            htlc_payment.append(payment_index)
+            htlc_status.append(_status_code(HTLC_STATUSES, htlc.get("status")))
+            htlc_fee_msat.append(int(htlc["route"]["total_fees_msat"]))
+
+            for hop in htlc["route"]["hops"]:
+                hop_htlc.append(htlc_index)
+                hop_pubkey.append(pubkey_ids.setdefault(hop["pub_key"], len(pubkey_ids)))
+                hop_fee_msat.append(int(hop["fee_msat"]))
+
+    return {
+        'payment_creation_time': np.array(payment_creation_time, dtype=np.int64),
+        'payment_status': np.array(payment_status, dtype=np.int8),
+        'htlc_payment': np.array(htlc_payment, dtype=np.int64),
+        'htlc_status': np.array(htlc_status, dtype=np.int8),
+        'htlc_fee_msat': np.array(htlc_fee_msat, dtype=np.int64),
+        'hop_htlc': np.array(hop_htlc, dtype=np.int64),
+        'hop_pubkey': np.array(hop_pubkey, dtype=np.int64),
+        'hop_fee_msat': np.array(hop_fee_msat, dtype=np.int64),
+        'pubkeys': np.array(list(pubkey_ids), dtype='<U66'),
+    }
+
+def read_payment_batches(file_path):
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+
+    yield flatten_payments(data.get('payments', []))
+
+def load_payments(file_path):
+    # Loads a payments file (eg, lnd_0.json or *_payments.json) as columnar tables, using the on-disk cache
+    # so that only the first read of a file parses its JSON.
+    return cache.load_columns(file_path, 'payments', read_payment_batches)
+
+def pubkey_id(tables, pubkey):
+    # Returns the interned id of pubkey, or -1 if it isn't in any route.
+    matches = np.flatnonzero(tables['pubkeys'] == pubkey)
+    return int(matches[0]) if len(matches) else -1
+
+def first_hop_pubkey(tables):
+    # Returns the pubkey of the first hop of the first htlc of the first payment.
+    htlc = np.flatnonzero(tables['htlc_payment'] == 0)[0]
+    hop = np.flatnonzero(tables['hop_htlc'] == htlc)[0]
+    return str(tables['pubkeys'][tables['hop_pubkey'][hop]])
+
+def _period_masks(tables, start_time_ns, end_time_ns):
+    # Selects the payments created in the period, and their htlcs and hops, along with which htlcs (and the
+    # hops of those htlcs) succeeded.
+    creation_time = tables['payment_creation_time']
+    payment_in_period = (start_time_ns <= creation_time) & (creation_time <= end_time_ns)
+
+    htlc_in_period = payment_in_period[tables['htlc_payment']]
+    htlc_success = tables['htlc_status'] == HTLC_STATUSES.index('SUCCEEDED')
+
+    return {
+        'payment_in_period': payment_in_period,
+        'htlc_in_period': htlc_in_period,
+        'htlc_success': htlc_success,
+        'hop_in_period': htlc_in_period[tables['hop_htlc']],
+        'hop_success': htlc_success[tables['hop_htlc']],
+    }
+
+def hop_positions(tables):
+    # Returns the position of each hop in its htlc's route, starting from 0 for the first hop. Hops are stored
+    # grouped by htlc, so this is each hop's offset from the first hop of its htlc.
+    hop_htlc = tables['hop_htlc']
+    return np.arange(len(hop_htlc)) - np.searchsorted(hop_htlc, hop_htlc, side='left')
+
+def attacker_costs(tables, target_pubkey, start_time_ns, end_time_ns):
+    # Columnar equivalent of costs.process_attacker_payments. Any pubkey can be used as the target, to find the
+    # fees that the attacker paid to that node.
+    masks = _period_masks(tables, start_time_ns, end_time_ns)
+    htlc_in_period = masks['htlc_in_period']
+    htlc_fee_msat = tables['htlc_fee_msat']
+
+    target_hop = (tables['hop_pubkey'] == pubkey_id(tables, target_pubkey)) & masks['hop_in_period']
+    target_hop_success = target_hop & masks['hop_success']
+    hop_fee_msat = tables['hop_fee_msat']
+
+    return {
+        'attacker_total': int(masks['payment_in_period'].sum() + htlc_in_period.sum()),
+        'attacker_success_msat': int(htlc_fee_msat[htlc_in_period & masks['htlc_success']].sum()),
+        'attacker_unconditional_msat': int(htlc_fee_msat[htlc_in_period].sum()) * 0.01,
+        'target_total': int(target_hop.sum()),
+        'target_success_msat': int(hop_fee_msat[target_hop_success].sum()),
+        'target_unconditional_msat': int(hop_fee_msat[target_hop].sum()) * 0.01,
+    }
+
+def _sum_by(keys, key_count, values, selected):
+    # Sums int64 values by key over the selected rows. np.add.at is used rather than bincount so that msat
+    # totals stay exact instead of being summed as floats.
+    totals = np.zeros(key_count, dtype=np.int64)
+    np.add.at(totals, keys[selected], values[selected])
+    return totals
+
+def _fee_breakdown(tables, keys, key_count, start_time_ns, end_time_ns, selected=None):
+    masks = _period_masks(tables, start_time_ns, end_time_ns)
+    in_period = masks['hop_in_period'] if selected is None else masks['hop_in_period'] & selected
+    hop_fee_msat = tables['hop_fee_msat']
+    ones = np.ones(len(hop_fee_msat), dtype=np.int64)
+
+    return {
+        'hops': _sum_by(keys, key_count, ones, in_period),
+        'success_msat': _sum_by(keys, key_count, hop_fee_msat, in_period & masks['hop_success']),
+        'unconditional_msat': _sum_by(keys, key_count, hop_fee_msat, in_period) * 0.01,
+    }
+
+def node_fees(tables, start_time_ns, end_time_ns):
+    # Breaks down the fees that the attacker paid in the period by the node that they were paid to, for every
+    # node in its routes. Returns columns indexed like tables['pubkeys'], in the same units as attacker_costs'
+    # target totals.
+    breakdown = _fee_breakdown(tables, tables['hop_pubkey'], len(tables['pubkeys']), start_time_ns, end_time_ns)
+    return {'pubkey': np.asarray(tables['pubkeys']), **breakdown}
+
+def hop_fees(tables, start_time_ns, end_time_ns, pubkey=None):
+    # Breaks down the fees that the attacker paid in the period by position in the route (0 for the first hop),
+    # either for every node or only for pubkey.
+    positions = hop_positions(tables)
+    position_count = int(positions.max()) + 1 if len(positions) else 0
+
+    selected = None
+    if pubkey is not None:
+        selected = tables['hop_pubkey'] == pubkey_id(tables, pubkey)
+
+    breakdown = _fee_breakdown(tables, positions, position_count, start_time_ns, end_time_ns, selected)
+    return {'position': np.arange(position_count), **breakdown}
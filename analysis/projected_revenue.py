@@ -1,55 +1,154 @@
 import statistics
 import sys
-import csv
 import time
 import os
-import target_jammed
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import cache
 
-def get_projected_revenue(file_path, node_id, revenue_period_ns):
-    total_fees = 0
-    timestamp_limit = None
-
-    with open(file_path, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            incoming_amt = int(row['incoming_amt'])
-            outgoing_amt = int(row['outgoing_amt'])
-            forwarding_alias = row['forwarding_alias']
-            incoming_add_ts = int(row['incoming_add_ts'])
-            incoming_remove_ts = int(row['incoming_remove_ts'])
-           
-            # We want to only get entries for the period that we've defined to have a way to compare revenue to what we got in the simulation 
-            # that ran for revenue_period_ns. We don't have a start time for this projected data, so we just grab our first timestamp as the 
-            # start. This is imperfect, and may lead to us over-estimating revenue without an attack (especially if there was a long wait 
-            # for the first payment to occur). This could possibly be improved by including the start time in the file name so we can get 
-            # an exact start, but is okay for now.
-            # 
-            # We can't use actual timestamps here, because this data was generated once-off and has old timestamps (hasn't been "progressed"
-            # to current times like we do for bootstrapped data, as this isn't actually necessary).
-            if timestamp_limit is None:
-                timestamp_limit = incoming_add_ts + revenue_period_ns
-
-            if incoming_add_ts >= timestamp_limit:
-                break
-            
-            if forwarding_alias == node_id and incoming_remove_ts < timestamp_limit:
-                total_fees += (incoming_amt - outgoing_amt)
-    
-    return total_fees
+PROJECTION_COLUMNS = {
+    'incoming_amt': np.int64,
+    'outgoing_amt': np.int64,
+    'forwarding_alias': str,
+    'incoming_add_ts': np.int64,
+    'incoming_remove_ts': np.int64,
+}
 
+def read_projection_chunks(file_path, chunk_size=250000):
+    # Reads the columns of a sim-ln htlc_forwards.csv that we need for revenue projections, in chunks of
+    # chunk_size rows.
+    try:
+        yield from pd.read_csv(file_path, usecols=list(PROJECTION_COLUMNS), dtype=PROJECTION_COLUMNS,
+                               keep_default_na=False, chunksize=chunk_size)
+    except pd.errors.EmptyDataError:
+        return
 
-def get_revenue_stats(network_name, node_id, revenue_period_ns):
-    data_path = os.path.join("data", network_name, "projections")
+def read_revenue_index_batches(file_path):
+    # Builds a revenue index for a projection file, so that revenue for any node over any period is a binary
+    # search rather than a scan of the file. get_projected_revenue counts a forward towards a period if it was
+    # removed before the end of the period and it comes before the first forward in the file that was added
+    # after the end of the period. Both hold if the later of its removal and the latest add time up to and
+    # including it in the file (key) is before the end of the period. Forwards are grouped by forwarding_alias
+    # (aliases[i]'s rows are alias_start[i]:alias_start[i+1]), sorted by key, with a running total of their fees.
+    #
+    # Chunks are reduced to int64 keys, fees and interned alias ids as they're read, so only those columns (rather
+    # than every chunk's DataFrame) are held while the index is sorted.
+    alias_ids = {}
+    first_add_ts = np.empty(0, dtype=np.int64)
+    latest_add_ts = None
+    keys, fees, chunk_alias_ids = [], [], []
+
+    for chunk in read_projection_chunks(file_path):
+        if len(chunk) == 0:
+            continue
+
+        incoming_add_ts = chunk['incoming_add_ts'].to_numpy()
+        if latest_add_ts is None:
+            first_add_ts = incoming_add_ts[:1]
+            latest_add_ts = incoming_add_ts[0]
+
+        running_add_ts = np.maximum(np.maximum.accumulate(incoming_add_ts), latest_add_ts)
+        latest_add_ts = running_add_ts[-1]
+
+        keys.append(np.maximum(running_add_ts, chunk['incoming_remove_ts'].to_numpy()))
+        fees.append(chunk['incoming_amt'].to_numpy() - chunk['outgoing_amt'].to_numpy())
+
+        names, inverse = np.unique(chunk['forwarding_alias'].to_numpy(), return_inverse=True)
+        ids = np.array([alias_ids.setdefault(name, len(alias_ids)) for name in names], dtype=np.int64)
+        chunk_alias_ids.append(ids[inverse])
+
+    if latest_add_ts is None:
+        yield {
+            'first_add_ts': np.empty(0, dtype=np.int64),
+            'aliases': np.empty(0, dtype='<U1'),
+            'alias_start': np.zeros(1, dtype=np.int64),
+            'key': np.empty(0, dtype=np.int64),
+            'cum_fees': np.zeros(1, dtype=np.int64),
+        }
+        return
+
+    key = np.concatenate(keys)
+    fees = np.concatenate(fees)
+
+    # Renumber aliases in sorted order, so they're grouped the same way as np.unique would.
+    aliases = np.array(list(alias_ids), dtype=str)
+    alias_order = np.argsort(aliases, kind='stable')
+    alias_rank = np.empty(len(aliases), dtype=np.int64)
+    alias_rank[alias_order] = np.arange(len(aliases))
+    aliases = aliases[alias_order]
+    alias_id = alias_rank[np.concatenate(chunk_alias_ids)]
+
+    order = np.lexsort((key, alias_id))
+
+    yield {
+        'first_add_ts': first_add_ts,
+        'aliases': aliases.astype(str),
+        'alias_start': np.searchsorted(alias_id[order], np.arange(len(aliases) + 1)).astype(np.int64),
+        'key': key[order],
+        'cum_fees': np.concatenate([[0], np.cumsum(fees[order])]).astype(np.int64),
+    }
+
+def load_revenue_index(file_path):
+    # The index is cached next to the projections, and rebuilt if the projection file changes.
+    return cache.load_columns(file_path, 'revenue_index', read_revenue_index_batches)
+
+def _build_revenue_index(file_path):
+    load_revenue_index(file_path)
+
+def indexed_revenue(index, node_id, revenue_period_ns):
+    if len(index['first_add_ts']) == 0:
+        return 0
+
+    # We want to only get entries for the period that we've defined to have a way to compare revenue to what we got in the simulation 
+    # that ran for revenue_period_ns. We don't have a start time for this projected data, so we just grab our first timestamp as the 
+    # start. This is imperfect, and may lead to us over-estimating revenue without an attack (especially if there was a long wait 
+    # for the first payment to occur). This could possibly be improved by including the start time in the file name so we can get 
+    # an exact start, but is okay for now.
+    # 
+    # We can't use actual timestamps here, because this data was generated once-off and has old timestamps (hasn't been "progressed"
+    # to current times like we do for bootstrapped data, as this isn't actually necessary).
+    timestamp_limit = int(index['first_add_ts'][0]) + revenue_period_ns
+
+    alias = np.flatnonzero(index['aliases'] == node_id)
+    if len(alias) == 0:
+        return 0
+
+    start, end = index['alias_start'][alias[0]], index['alias_start'][alias[0] + 1]
+    count = np.searchsorted(index['key'][start:end], timestamp_limit, side='left')
+
+    return int(index['cum_fees'][start + count] - index['cum_fees'][start])
+
+def get_projected_revenue(file_path, node_id, revenue_period_ns):
+    return indexed_revenue(load_revenue_index(file_path), node_id, revenue_period_ns)
+
+def projection_files(network_name):
     data_path = os.path.join("data", network_name, "projections")
     if not os.path.exists(data_path):
         print(f"Projected revenue not generated in {data_path}. Please run `./attackathon/setup/get_projections.sh` {network_name} to generate it.")
         sys.exit(1)
 
-    projected_values = []
-    for filename in os.listdir(data_path):
-        projected_data = os.path.join(data_path, filename)
-        projected = get_projected_revenue(projected_data, node_id, revenue_period_ns)
-        projected_values.append(projected)
+    # Skip the index cache that's kept alongside the projections.
+    return [os.path.join(data_path, filename) for filename in sorted(os.listdir(data_path))
+            if not filename.startswith('.') and os.path.isfile(os.path.join(data_path, filename))]
+
+def load_revenue_indexes(network_name, workers=None):
+    # Returns the revenue index of every projection run for a network. Indexes that are missing or out of date
+    # are built in parallel, since parsing the CSVs is the bulk of the work. If they can't be cached, they're
+    # built as they're loaded instead.
+    files = projection_files(network_name)
+
+    stale = [file_path for file_path in files
+             if cache.lookup(file_path, 'revenue_index') is None and cache.writable(file_path)]
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_build_revenue_index, stale))
+
+    return [load_revenue_index(file_path) for file_path in files]
+
+def get_revenue_stats(network_name, node_id, revenue_period_ns, workers=None):
+    projected_values = [indexed_revenue(index, node_id, revenue_period_ns)
+                        for index in load_revenue_indexes(network_name, workers)]
 
     mean_revenue = statistics.mean(projected_values)
     std_dev_revenue = statistics.stdev(projected_values)
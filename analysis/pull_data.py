@@ -1,34 +1,114 @@
 import sys
-import json
 import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import analyse_attack
 import costs
+import forwarding_history
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python pull_data.py <node_count>")
-        sys.exit(1)
+print_lock = threading.Lock()
 
-    node_count = int(sys.argv[1])
-    directory = f"ln_{node_count}"
+def log(message):
+    with print_lock:
+        print(message, flush=True)
 
-    os.makedirs(directory, exist_ok=True)
+def node_files(directory, padded_node_id):
+    return {
+        'forwarding_history': os.path.join(directory, f"{padded_node_id}_forwarding_history.json"),
+        'thresholds': os.path.join(directory, f"{padded_node_id}_thresholds.json"),
+        'payments': os.path.join(directory, f"{padded_node_id}_payments.json"),
+    }
+
+def pull_forwarding_history(padded_node_id, file_path):
+    # Circuitbreaker always returns the full history, so we download it to the side and only append the forwards
+    # that are new since our last pull.
+    download_path = f"{file_path}.download"
+    if analyse_attack.save_forwarding_history(padded_node_id, download_path) != 0:
+        raise RuntimeError(f"Failed to pull {file_path}")
+
+    forwarding_history.append_forwarding_history(download_path, file_path)
+    os.remove(download_path)
+
+def pull_thresholds(padded_node_id, file_path):
+    # Thresholds are a snapshot, so they're written to a temporary path and only moved into place once the pull
+    # has succeeded.
+    tmp_path = f"{file_path}.tmp"
+    if analyse_attack.save_thresholds(padded_node_id, tmp_path) != 0:
+        raise RuntimeError(f"Failed to pull {file_path}")
+
+    os.replace(tmp_path, file_path)
+
+def pull_payments(padded_node_id, file_path):
+    # Only fetch payments after the last final payment that we pulled.
+    command = f"warcli lncli {padded_node_id}"
+    state = costs.load_payment_state(file_path, command)
+
+    for _ in costs.pull_payments(command, file_path, state):
+        pass
+
+    costs.save_payment_state(file_path, state)
+
+def pull_node(directory, index, update):
+    # Pulls any of the node's files that are incomplete, or all of them if update is set. Incremental pulls
+    # save their state once they've succeeded, so that's what marks them as complete.
+    padded_node_id = str(index).zfill(6)
+    files = node_files(directory, padded_node_id)
 
-    for index in range(node_count):
-        print(f"Pulling node {index}")
-        padded_node_id = str(index).zfill(6)
+    pulls = [
+        (pull_forwarding_history, files['forwarding_history'], forwarding_history.history_state_path(files['forwarding_history'])),
+        (pull_thresholds, files['thresholds'], files['thresholds']),
+        (pull_payments, files['payments'], costs.payment_state_path(files['payments'])),
+    ]
 
-        fwd_file = os.path.join(directory, f"{padded_node_id}_forwarding_history.json")
-        analyse_attack.save_forwarding_history(padded_node_id, fwd_file)
+    pulled = False
+    for pull, file_path, complete_path in pulls:
+        if update or not os.path.exists(complete_path):
+            pull(padded_node_id, file_path)
+            pulled = True
 
-        threshold_file = os.path.join(directory, f"{padded_node_id}_thresholds.json")
-        analyse_attack.save_thresholds(padded_node_id, threshold_file)
+    return pulled
 
-        command = f"warcli lncli {padded_node_id}"
-        result = costs.paginate_lncli_listpayments(command, 10000)
-        # Write to json file so that we can re-run if necessary.
+def pull_nodes(directory, node_count, workers, update=False):
+    # Pulls each node's forwarding history, thresholds and payments using a pool of workers. Most of the time
+    # for each pull is spent waiting on kubectl/lncli, so threads are enough to keep the cluster busy.
+    failed = []
+    done = 0
 
-        payments_file = os.path.join(directory, f"{padded_node_id}_payments.json")
-        with open(payments_file, 'w') as f:
-            json.dump({"payments": result}, f, indent=4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(pull_node, directory, index, update): index for index in range(node_count)}
 
+        for future in as_completed(futures):
+            index = futures[future]
+            done += 1
+
+            try:
+                pulled = future.result()
+            except Exception as e:
+                failed.append(index)
+                log(f"[{done}/{node_count}] Failed to pull node {index}: {e}")
+                continue
+
+            if pulled:
+                log(f"[{done}/{node_count}] Pulled node {index}")
+            else:
+                log(f"[{done}/{node_count}] Skipped node {index}, files already complete")
+
+    return sorted(failed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pull forwarding history, thresholds and payments for every node in a network.")
+    parser.add_argument("node_count", type=int)
+    parser.add_argument("--workers", type=int, default=8, help="number of nodes to pull concurrently")
+    parser.add_argument("--update", action="store_true", help="re-pull complete nodes, fetching only records that are new since the last pull")
+    args = parser.parse_args()
+
+    node_count = args.node_count
+    directory = f"ln_{node_count}"
+
+    os.makedirs(directory, exist_ok=True)
+
+    failed = pull_nodes(directory, node_count, args.workers, args.update)
+    if failed:
+        print(f"Failed to pull nodes: {failed}, re-run to retry them")
+        sys.exit(1)
@@ -0,0 +1,285 @@
+import glob
+import os
+import re
+import pandas as pd
+import aggregate
+import costs
+import forwarding_history
+import jam_windows
+import payments
+import projected_revenue
+import target_jammed
+import target_liquidity_jammed
+import thresholds
+
+# Artifacts are the parsed inputs of a results directory. Each one is loaded the first time that a metric asks
+# for it and then shared by every other metric, so adding a metric doesn't add another parse of the inputs.
+def _attacker_files(results):
+    # Attacker payments are saved as lnd_0.json, lnd_1.json, ... in the order of the attacking nodes.
+    files = glob.glob(results.path('lnd_*.json'))
+    files = [file for file in files if re.fullmatch(r'lnd_\d+\.json', os.path.basename(file))]
+    return sorted(files, key=lambda file: int(re.search(r'\d+', os.path.basename(file)).group()))
+
+def _target_pubkey(results):
+    # We're always sending from lnd_0 -> target, so the first hop of its first payment is the target.
+    if results.target_pubkey is not None:
+        return results.target_pubkey
+
+    return payments.first_hop_pubkey(results.artifact('attacker_payments')[0])
+
+def _attacker_costs(results):
+    target_pubkey = results.artifact('target_pubkey')
+    return [payments.attacker_costs(tables, target_pubkey, results.start_time_ns, results.end_time_ns)
+            for tables in results.artifact('attacker_payments')]
+
+ARTIFACTS = {
+    'history': lambda results: forwarding_history.load_history(results.path('forwarding_history.json')),
+    'channels': lambda results: target_liquidity_jammed.create_channels_df(results.path('channels.json')),
+    'htlcs': lambda results: thresholds.load_htlcs(results.path('thresholds.json')),
+    'attacker_files': _attacker_files,
+    'attacker_payments': lambda results: [payments.load_payments(file) for file in results.artifact('attacker_files')],
+    'target_pubkey': _target_pubkey,
+    'attacker_costs': _attacker_costs,
+}
+
+# The files that each artifact is read from, so that metrics whose inputs aren't in a directory can be skipped.
+ARTIFACT_FILES = {
+    'history': lambda results: [results.path('forwarding_history.json')],
+    'channels': lambda results: [results.path('channels.json')],
+    'htlcs': lambda results: [results.path('thresholds.json')],
+    'attacker_payments': lambda results: results.artifact('attacker_files')[:1] or [results.path('lnd_0.json')],
+}
+
+class Results:
+    # A results directory, as written by analyse_attack or pulled from a run, along with the period of the attack
+    # that's being analysed. Artifacts and metrics are computed at most once.
+    def __init__(self, directory, start_time_ns, end_time_ns, target_pubkey=None, network_name=None, node_id=None,
+                 lower_bound=440, liq_jam_ratio=0.9):
+        self.directory = directory
+        self.start_time_ns = start_time_ns
+        self.end_time_ns = end_time_ns
+        self.target_pubkey = target_pubkey
+        self.network_name = network_name
+        self.node_id = node_id
+        self.lower_bound = lower_bound
+        self.liq_jam_ratio = liq_jam_ratio
+
+        self._artifacts = {}
+        self._metrics = {}
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def provide(self, name, value):
+        # Supplies an artifact that was produced elsewhere (eg, attacker costs computed while pulling payments),
+        # instead of loading it from the directory.
+        self._artifacts[name] = value
+
+    def artifact(self, name):
+        if name not in self._artifacts:
+            self._artifacts[name] = ARTIFACTS[name](self)
+
+        return self._artifacts[name]
+
+    def has_artifact(self, name):
+        if name in self._artifacts:
+            return True
+        if name == 'attacker_costs':
+            return self.has_artifact('attacker_payments')
+        if name not in ARTIFACT_FILES:
+            return True
+
+        return all(os.path.exists(file) for file in ARTIFACT_FILES[name](self))
+
+    def can_run(self, name):
+        requires, _ = METRICS[name]
+        return all(self.has_artifact(artifact) for artifact in requires)
+
+    def metric(self, name):
+        if name not in self._metrics:
+            _, run = METRICS[name]
+            self._metrics[name] = run(self)
+
+        return self._metrics[name]
+
+    def run(self, names=None):
+        # Runs the named metrics, or every metric whose inputs are in the directory, returning their results.
+        if names is None:
+            names = [name for name in METRICS if self.can_run(name)]
+
+        return {name: self.metric(name) for name in names}
+
+# Metrics are plugins that compute their results (a dict, or a DataFrame for breakdowns) from a Results' shared
+# artifacts or other metrics.
+def _costs_metric(results):
+    totals = costs.process_attacker_payments([], None, results.start_time_ns, results.end_time_ns)
+    for attacker_costs in results.artifact('attacker_costs'):
+        costs.add_costs(totals, attacker_costs)
+
+    totals['attacker_total_msat'] = totals['attacker_success_msat'] + totals['attacker_unconditional_msat']
+    totals['attacker_to_target_msat'] = totals['target_success_msat'] + totals['target_unconditional_msat']
+    return totals
+
+def _revenue_metric(results):
+    success_revenue, unconditional_revenue = costs.get_target_revenue(
+        results.artifact('history'), results.start_time_ns, results.end_time_ns)
+    target_revenue = success_revenue + unconditional_revenue
+
+    revenue = {
+        'success_msat': success_revenue,
+        'unconditional_msat': unconditional_revenue,
+        'total_msat': target_revenue,
+    }
+
+    # Break the target's revenue down into what the attacker paid and what honest traffic paid, if we know
+    # what the attacker paid.
+    if results.can_run('costs'):
+        attacker_to_target = results.metric('costs')['attacker_to_target_msat']
+        revenue['honest_msat'] = target_revenue - attacker_to_target
+        revenue['attacker_percent'] = round(attacker_to_target * 100 / target_revenue, 2) if target_revenue else None
+        revenue['honest_percent'] = round(revenue['honest_msat'] * 100 / target_revenue, 2) if target_revenue else None
+
+    # Projected revenue comes from the network's projection runs rather than the results directory.
+    if results.network_name is not None and results.node_id is not None:
+        revenue['projected_mean_msat'], revenue['projected_std_dev_msat'] = projected_revenue.get_revenue_stats(
+            results.network_name, results.node_id, results.end_time_ns - results.start_time_ns)
+
+    return revenue
+
+def _slot_jam_metric(results):
+    return {'jam_time_min': target_jammed.get_jam_time(results.artifact('history'), results.lower_bound)}
+
+def _liquidity_jam_metric(results):
+    schedule = forwarding_history.pair_schedule(results.artifact('history'))
+    high_locked_df = target_liquidity_jammed.track_funds(schedule, results.artifact('channels'),
+                                                          results.liq_jam_ratio)
+    return {'jam_time_min': target_liquidity_jammed.first_channel_jam_time(high_locked_df)}
+
+def _jam_windows_metric(results):
+    schedule = forwarding_history.pair_schedule(results.artifact('history'))
+    windows = jam_windows.schedule_windows(schedule, results.artifact('channels'), results.lower_bound,
+                                           results.liq_jam_ratio, results.end_time_ns)
+    return jam_windows.summarize_windows(windows)
+
+def _drop_counts_metric(results):
+    return aggregate.outcome_counts(results.artifact('htlcs')['outcome'])
+
+def _success_rate_metric(results):
+    counts = {}
+    for tables in results.artifact('attacker_payments'):
+        aggregate.merge_counts(counts, aggregate.status_counts(tables['payment_status']))
+
+    counts['success_rate'] = aggregate.success_rate(counts)
+    return counts
+
+def _fee_frame(breakdowns, by):
+    # Sums the fee breakdowns of each attacker, which are keyed by pubkey or route position.
+    frames = [pd.DataFrame(breakdown) for breakdown in breakdowns]
+    if not frames:
+        return pd.DataFrame(columns=[by, 'hops', 'success_msat', 'unconditional_msat'])
+
+    return pd.concat(frames, ignore_index=True).groupby(by, sort=False).sum().reset_index()
+
+def _node_fees_metric(results):
+    # Fees that the attackers paid to every node in their routes, most paid first.
+    fees = _fee_frame([payments.node_fees(tables, results.start_time_ns, results.end_time_ns)
+                       for tables in results.artifact('attacker_payments')], 'pubkey')
+    fees['total_msat'] = fees['success_msat'] + fees['unconditional_msat']
+    return fees.sort_values('total_msat', ascending=False, kind='stable').reset_index(drop=True)
+
+def _target_hop_fees_metric(results):
+    # Fees that the attackers paid to the target, by the target's position in the route.
+    target_pubkey = results.artifact('target_pubkey')
+    fees = _fee_frame([payments.hop_fees(tables, results.start_time_ns, results.end_time_ns, target_pubkey)
+                       for tables in results.artifact('attacker_payments')], 'position')
+    return fees.sort_values('position').reset_index(drop=True)
+
+# Each metric is registered with the artifacts that it needs.
+METRICS = {
+    'costs': (['attacker_costs'], _costs_metric),
+    'revenue': (['history'], _revenue_metric),
+    'slot_jam': (['history'], _slot_jam_metric),
+    'liquidity_jam': (['history', 'channels'], _liquidity_jam_metric),
+    'jam_windows': (['history', 'channels'], _jam_windows_metric),
+    'drop_counts': (['htlcs'], _drop_counts_metric),
+    'success_rate': (['attacker_payments'], _success_rate_metric),
+    'node_fees': (['attacker_payments'], _node_fees_metric),
+    'target_hop_fees': (['attacker_payments'], _target_hop_fees_metric),
+}
+
+# Columns of the result CSV, and the metric value that each one is taken from.
+CSV_COLUMNS = [
+    ('attacker_success_msat', 'costs', 'attacker_success_msat'),
+    ('attacker_unconditional_msat', 'costs', 'attacker_unconditional_msat'),
+    ('target_success_msat', 'revenue', 'success_msat'),
+    ('target_unconditional_msat', 'revenue', 'unconditional_msat'),
+    ('attacker_to_target_msat', 'costs', 'attacker_to_target_msat'),
+    ('jam_time_min', 'slot_jam', 'jam_time_min'),
+    ('liquidity_jam_time', 'liquidity_jam', 'jam_time_min'),
+]
+
+def print_report(results, values):
+    # Prints the results of each metric that was run, followed by a CSV row of the headline numbers.
+    if 'costs' in values:
+        attacker = values['costs']
+        print()
+        print(f"Attacker sent: {attacker['attacker_total']} payments paying {attacker['attacker_total_msat']} msat fees")
+        print(f"- Success fees: {attacker['attacker_success_msat']} msat ({attacker['target_success_msat']} to target)")
+        print(f"- Unconditional fees: {attacker['attacker_unconditional_msat']} msat "
+              f"({attacker['target_unconditional_msat']} to target)\n")
+
+    if 'revenue' in values:
+        revenue = values['revenue']
+        if 'projected_mean_msat' in revenue:
+            print(f"Target revenue without attack: {revenue['projected_mean_msat']} msat "
+                  f"(standard deviation: {revenue['projected_std_dev_msat']})")
+
+        print(f"Target revenue under attack: {revenue['total_msat']} msat")
+        print(f"- Success Fees: {revenue['success_msat']} msat")
+        print(f"- Unconditional fees: {revenue['unconditional_msat']} msat\n")
+
+        if 'honest_msat' in revenue:
+            print("Breakdown of target's revenue under attack:")
+            print(f"- Attacker paid {revenue['attacker_percent']}%: {values['costs']['attacker_to_target_msat']} msat")
+            print(f"- Honest traffic paid {revenue['honest_percent']}%: {revenue['honest_msat']} msat\n")
+
+    if 'slot_jam' in values:
+        print(f"Total amount slot jammed > {results.lower_bound} slots: {values['slot_jam']['jam_time_min']} minutes")
+
+    if 'liquidity_jam' in values:
+        print(f"Total amount liquidity jammed > {round(results.liq_jam_ratio * 100)}%: "
+              f"{values['liquidity_jam']['jam_time_min']} minutes")
+
+    # Total jam time may be spread across the run, so also report the longest single stretch and when (if ever)
+    # the target was first jammed for an hour.
+    if 'jam_windows' in values:
+        windows = values['jam_windows']
+        if windows['longest'] is not None:
+            print(f"Longest continuous jam: {windows['longest']['duration_minutes']} minutes")
+        if windows['goal_met_ns'] is not None:
+            print(f"Jammed for an hour at: {windows['goal_met_ns']}\n")
+        else:
+            print("Not jammed for an hour\n")
+
+    if 'drop_counts' in values:
+        aggregate.print_outcomes(values['drop_counts'])
+        print()
+
+    if 'success_rate' in values:
+        aggregate.print_statuses(values['success_rate'])
+        print()
+
+    if 'node_fees' in values:
+        print("Attacker fees by node (top 10):")
+        print(values['node_fees'].head(10).to_string(index=False))
+        print()
+
+    if 'target_hop_fees' in values:
+        print("Attacker fees to target by route position:")
+        print(values['target_hop_fees'].to_string(index=False))
+        print()
+
+    columns = [(column, metric, key) for column, metric, key in CSV_COLUMNS if metric in values]
+    print("Result CSV:")
+    print(",".join(column for column, _, _ in columns))
+    print(",".join(str(values[metric][key]) for _, metric, key in columns))
@@ -1,45 +1,16 @@
-import os
 import sys
-import json
+import aggregate
 
-def calculate_success_rate(directory):
-    # Initialize counters
-    succeeded_count = 0
-    failed_count = 0
+def calculate_success_rate(directory, workers=None):
+    # Count the statuses of the payments in every payments file in parallel
+    summary = aggregate.aggregate(directory, workers, kinds=['payments'])
 
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith("payments.json"):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'r') as f:
-                    try:
-                        data = json.load(f)
-                    except json.JSONDecodeError:
-                        print(f"Failed to parse {file_path}. Skipping.")
-                        continue
-
-                    # Iterate over each payment in the current file and count statuses
-                    for payment in data.get("payments", []):
-                        status = payment.get("status")
-                        if status == "SUCCEEDED":
-                            succeeded_count += 1
-                        elif status == "FAILED":
-                            failed_count += 1
-
-    total_count = succeeded_count + failed_count
-
-    if total_count == 0:
-        print("No payments found across files.")
-        return
-
-    # Calculate success rate
-    success_rate = (succeeded_count / total_count) * 100
+    for file_path, _ in summary['errors']:
+        print(f"Failed to parse {file_path}. Skipping.")
 
     # Output results
-    print(f"Total payments across all files: {total_count}")
-    print(f"Succeeded: {succeeded_count}")
-    print(f"Failed: {failed_count}")
-    print(f"Success rate: {success_rate:.2f}%")
+    aggregate.print_statuses(summary['totals']['payments'])
+    return summary
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import numpy as np
+
+# Synthetic runs start at a fixed time so that generated files are reproducible for a given seed.
+START_TIME_NS = 1700000000 * 10**9
+MAX_HTLC_COUNT = 483
+
+def _pubkey(rng):
+    return "02" + rng.bytes(32).hex()
+
+def _scids(count):
+    # Short channel ids in the same block/tx/output layout that warnet uses, one channel per block.
+    blocks = np.arange(300, 300 + count, dtype=np.int64)
+    return (blocks << 40) | (1 << 16)
+
+def _write_array(file, key, chunks):
+    # Writes {"<key>": [...]} with one entry per line. chunks is a list of callables that each return the lines
+    # for one chunk of entries, so that large files are formatted a chunk at a time.
+    file.write(f'{{"{key}": [')
+    written = False
+    for chunk in chunks:
+        for line in chunk():
+            file.write((',\n' if written else '\n') + line)
+            written = True
+    file.write('\n]}\n')
+
+def generate_channels(rng, channel_count):
+    scids = _scids(channel_count)
+    # Capacities are log-uniform between 100k and 50M sats, roughly in line with mainnet routing nodes.
+    capacities = np.exp(rng.uniform(np.log(1e5), np.log(5e7), channel_count)).astype(np.int64)
+
+    return {
+        'scids': scids,
+        'capacities': capacities,
+        'pubkeys': [_pubkey(rng) for _ in range(channel_count)],
+    }
+
+def generate_forwards(rng, channels, forward_count, rate, jam_fraction, jam_hold_secs):
+    # Honest forwards arrive as a poisson process at rate per second and are held for a second or so between
+    # random pairs of channels. A jam_fraction of forwards are sent by an attacker, which holds them for around
+    # jam_hold_secs on a tenth of the target's channels so that the jamming metrics have something to find.
+    channel_count = len(channels['scids'])
+    add_time = START_TIME_NS + np.cumsum(rng.exponential(1e9 / rate, forward_count)).astype(np.int64)
+
+    incoming = rng.integers(0, channel_count, forward_count)
+    outgoing = (incoming + rng.integers(1, max(channel_count, 2), forward_count)) % channel_count
+    hold_ns = rng.exponential(1e9, forward_count)
+
+    is_jam = rng.random(forward_count) < jam_fraction
+    jammed_channels = max(channel_count // 10, 1)
+    outgoing[is_jam] = rng.integers(0, jammed_channels, int(is_jam.sum()))
+    hold_ns[is_jam] = rng.uniform(0.5, 1.5, int(is_jam.sum())) * jam_hold_secs * 1e9
+
+    # Amounts are log-normal around 50k sats, and capped so that a single htlc can't exceed the channel's
+    # capacity. Attacker htlcs are large enough that a few hundred of them lock up most of the channel.
+    outgoing_amount = np.exp(rng.normal(np.log(5e7), 1.5, forward_count)).astype(np.int64)
+    capacity_msat = channels['capacities'][outgoing] * 1000
+    outgoing_amount[is_jam] = capacity_msat[is_jam] // (MAX_HTLC_COUNT // 2)
+    outgoing_amount = np.clip(outgoing_amount, 1000, capacity_msat // 2)
+    incoming_amount = outgoing_amount + 1000 + outgoing_amount // 1000
+
+    # Runs are observed while in progress, so forwards that would resolve after the last add are unresolved.
+    resolve_time = add_time + hold_ns.astype(np.int64)
+    resolved = resolve_time <= add_time[-1] if forward_count else np.zeros(0, dtype=bool)
+    settled = rng.random(forward_count) < 0.9
+
+    return {
+        'add_time': add_time,
+        'resolve_time': resolve_time,
+        'resolved': resolved,
+        'settled': settled & ~is_jam,
+        'incoming_amount': incoming_amount,
+        'outgoing_amount': outgoing_amount,
+        'incoming_scid': channels['scids'][incoming],
+        'outgoing_scid': channels['scids'][outgoing],
+    }
+
+def _chunk_columns(columns, start, chunk_size):
+    # Python lists are much quicker to format from than numpy scalars.
+    return zip(*(column[start:start + chunk_size].tolist() for column in columns))
+
+def write_forwarding_history(file_path, forwards, chunk_size=100000):
+    count = len(forwards['add_time'])
+    columns = [forwards[name] for name in ('incoming_scid', 'outgoing_scid', 'add_time', 'resolve_time', 'resolved',
+                                           'settled', 'incoming_amount', 'outgoing_amount')]
+
+    def chunk(start):
+        def lines():
+            rows = _chunk_columns(columns, start, chunk_size)
+            for i, (incoming, outgoing, add, resolve, resolved, settled, incoming_amt, outgoing_amt) in enumerate(rows, start):
+                resolve = f', "resolveTimeNs": "{resolve}"' if resolved else ''
+                settled = ', "settled": true' if resolved and settled else ''
+                yield (
+                    f'{{"incomingCircuit": {{"shortChannelId": "{incoming}", "htlcIndex": "{i}"}}, '
+                    f'"outgoingCircuit": {{"shortChannelId": "{outgoing}", "htlcIndex": "{i}"}}, '
+                    f'"addTimeNs": "{add}"{resolve}{settled}, '
+                    f'"incomingAmount": "{incoming_amt}", "outgoingAmount": "{outgoing_amt}"}}'
+                )
+        return lines
+
+    with open(file_path, 'w') as file:
+        _write_array(file, 'forwards', [chunk(start) for start in range(0, count, chunk_size)])
+
+def write_thresholds(file_path, rng, forwards, chunk_size=100000):
+    # One htlc per forward. Most are forwarded unendorsed (1), with some endorsed (2) and dropped for lack of
+    # resources (0) or an unknown outgoing channel (3).
+    count = len(forwards['add_time'])
+    outcomes = rng.choice(4, size=count, p=[0.05, 0.75, 0.19, 0.01])
+    columns = [forwards['add_time'], outcomes, forwards['incoming_scid'], forwards['outgoing_scid']]
+
+    def chunk(start):
+        def lines():
+            rows = _chunk_columns(columns, start, chunk_size)
+            for add, outcome, incoming, outgoing in rows:
+                yield (
+                    f'{{"forwardTsNs": "{add}", "outcome": {outcome}, '
+                    f'"incomingChannel": "{incoming}", "outgoingChannel": "{outgoing}"}}'
+                )
+        return lines
+
+    with open(file_path, 'w') as file:
+        _write_array(file, 'htlcs', [chunk(start) for start in range(0, count, chunk_size)])
+
+def write_channels(file_path, channels):
+    with open(file_path, 'w') as file:
+        json.dump({'channels': [
+            {'chan_id': str(scid), 'remote_pubkey': pubkey, 'capacity': str(capacity)}
+            for scid, pubkey, capacity in zip(channels['scids'], channels['pubkeys'], channels['capacities'])
+        ]}, file)
+
+def write_payments(file_path, rng, payment_count, target_pubkey, end_time_ns, chunk_size=100000):
+    # Attacker payments over the length of the run, each with one to three htlcs that route through the target
+    # half of the time.
+    creation_time = np.sort(rng.integers(START_TIME_NS, max(end_time_ns, START_TIME_NS + 1), payment_count))
+    htlc_counts = rng.integers(1, 4, payment_count)
+    attacker_pubkeys = [_pubkey(rng) for _ in range(8)]
+
+    def htlc(succeeded, via_target):
+        hops = [attacker_pubkeys[rng.integers(0, len(attacker_pubkeys))]]
+        if via_target:
+            hops.append(target_pubkey)
+        hops.append(attacker_pubkeys[rng.integers(0, len(attacker_pubkeys))])
+
+        fees = rng.integers(1000, 100000, len(hops) - 1).tolist() + [0]
+        route = {
+            'total_fees_msat': str(sum(fees)),
+            'hops': [{'pub_key': pubkey, 'fee_msat': str(fee)} for pubkey, fee in zip(hops, fees)],
+        }
+        return {'status': 'SUCCEEDED' if succeeded else 'FAILED', 'route': route}
+
+    def chunk(start):
+        def lines():
+            for i in range(start, min(start + chunk_size, payment_count)):
+                succeeded = rng.random() < 0.3
+                htlcs = [htlc(succeeded and j == htlc_counts[i] - 1, rng.random() < 0.5) for j in range(htlc_counts[i])]
+                yield json.dumps({
+                    'payment_index': str(i + 1),
+                    'creation_time_ns': str(creation_time[i]),
+                    'status': 'SUCCEEDED' if succeeded else 'FAILED',
+                    'htlcs': htlcs,
+                })
+        return lines
+
+    with open(file_path, 'w') as file:
+        _write_array(file, 'payments', [chunk(start) for start in range(0, payment_count, chunk_size)])
+
+def generate(directory, forward_count, channel_count, payment_count=None, rate=50, jam_fraction=0.05,
+             jam_hold_secs=600, seed=0):
+    # Writes forwarding_history.json, thresholds.json, channels.json and payments.json for a synthetic target
+    # node to directory, along with synthetic.json which describes the run (including its start and end time,
+    # and the target's pubkey) so that the analysis can be pointed at it.
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    if payment_count is None:
+        payment_count = max(forward_count // 10, 1)
+
+    channels = generate_channels(rng, channel_count)
+    forwards = generate_forwards(rng, channels, forward_count, rate, jam_fraction, jam_hold_secs)
+    end_time_ns = int(forwards['add_time'][-1]) if forward_count else START_TIME_NS
+    target_pubkey = _pubkey(rng)
+
+    write_forwarding_history(os.path.join(directory, 'forwarding_history.json'), forwards)
+    write_thresholds(os.path.join(directory, 'thresholds.json'), rng, forwards)
+    write_channels(os.path.join(directory, 'channels.json'), channels)
+    write_payments(os.path.join(directory, 'payments.json'), rng, payment_count, target_pubkey, end_time_ns)
+
+    description = {
+        'forwards': forward_count,
+        'channels': channel_count,
+        'payments': payment_count,
+        'seed': seed,
+        'start_time_ns': START_TIME_NS,
+        'end_time_ns': end_time_ns,
+        'target_pubkey': target_pubkey,
+    }
+    with open(os.path.join(directory, 'synthetic.json'), 'w') as file:
+        json.dump(description, file, indent=2)
+
+    return description
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic analysis input files for a target node.")
+    parser.add_argument("directory")
+    parser.add_argument("--forwards", type=int, default=100000)
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--payments", type=int, help="number of attacker payments, defaults to a tenth of forwards")
+    parser.add_argument("--rate", type=float, default=50, help="honest forwards per second")
+    parser.add_argument("--jam-fraction", type=float, default=0.05, help="fraction of forwards held by the attacker")
+    parser.add_argument("--jam-hold-secs", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    description = generate(args.directory, args.forwards, args.channels, args.payments, args.rate,
+                           args.jam_fraction, args.jam_hold_secs, args.seed)
+    print(json.dumps(description, indent=2))
@@ -1,98 +1,152 @@
+import numpy as np
 import pandas as pd
-import json
+import forwarding_history
 import sys
 
-def was_channel_jammed(channel, eventDf):
-    filtered_df = eventDf[(eventDf['shortChannelId_outgoing'] == channel) | 
-                          (eventDf['shortChannelId_incoming'] == channel)]
-    slot_count = 0
-    time_slot_list = []
-    for index, row in filtered_df.iterrows():
-        if row['eventType'] == 'add':
-            slot_count += 1
-            time_slot_list.append({'time': row['eventTimeNs'], 'taken_slots': slot_count})
-        elif row['eventType'] == 'resolve':
-            slot_count -= 1
-            time_slot_list.append({'time': row['eventTimeNs'], 'taken_slots': slot_count})
-    result_df = pd.DataFrame(time_slot_list)
-    return result_df
-
-def process_all_channels(pair_schedule_df):
-    unique_channels = pd.unique(
-        pair_schedule_df[['shortChannelId_incoming', 'shortChannelId_outgoing']].values.ravel('K')
-    )
-    channel_results = {}
-    for channel in unique_channels:
-        result_df = was_channel_jammed(channel, pair_schedule_df)
-        channel_results[channel] = result_df
-    return channel_results
+# The most htlc slots that a channel can have in flight in one direction.
+MAX_SLOTS = 483
+
+def slot_timelines(schedule):
+    # Builds the slot occupancy of every channel over time in a single pass. Each event takes (add) or frees
+    # (resolve) a slot on both its incoming and outgoing channel, so we list every event once per channel it
+    # touches, group by channel (keeping time order) and take a cumulative sum of the +1/-1 slot changes.
+    incoming = schedule.column('incoming_scid')
+    outgoing = schedule.column('outgoing_scid')
+    delta = schedule.sign
+    event_idx = np.arange(len(schedule))
+
+    # Don't count an event twice if it comes in and goes out on the same channel.
+    both = outgoing != incoming
+    channels = np.concatenate([incoming, outgoing[both]])
+    event_idx = np.concatenate([event_idx, event_idx[both]])
+    delta = np.concatenate([delta, delta[both]])
+
+    # Group channels in the order that they first appear as an incoming channel, then as an outgoing channel,
+    # and keep each channel's events in time order.
+    channel_rank = pd.Index(pd.unique(channels)).get_indexer(channels)
+    order = np.lexsort((event_idx, channel_rank))
+
+    timelines = pd.DataFrame({
+        'channel': channels[order],
+        'time': schedule.event_time[event_idx[order]],
+        'delta': delta[order],
+    })
+    timelines['taken_slots'] = timelines.groupby('channel', sort=False)['delta'].cumsum()
+
+    return timelines.drop(columns='delta')
+
+def channel_timeline(all_channel_results, channel):
+    # Selects the time/taken_slots timeline for a single channel from slot_timelines' output.
+    chan_df = all_channel_results[all_channel_results['channel'] == channel]
+    return chan_df[['time', 'taken_slots']].reset_index(drop=True)
+
+def was_channel_jammed(channel, schedule):
+    filtered = schedule.select((schedule.column('outgoing_scid') == channel) |
+                               (schedule.column('incoming_scid') == channel))
+    return channel_timeline(slot_timelines(filtered), channel)
+
+def process_all_channels(schedule):
+    return slot_timelines(schedule)
 
 def find_channels_with_high_slots(all_channel_results, threshold=50):
-    channels_with_high_slots = []
-    for channel, df in all_channel_results.items():
-        if (df['taken_slots'] > threshold).any():
-            channels_with_high_slots.append(channel)
-    return channels_with_high_slots
+    max_slots = all_channel_results.groupby('channel', sort=False)['taken_slots'].max()
+    return max_slots.index[max_slots > threshold].tolist()
 
 def calculate_cumulative_time(chan_df, from_slots):
-    cumulative_time_ns = 0
-    start_time = None
+    # A jam period starts when taken slots reach from_slots and ends when they drop below it again. Periods
+    # that are still running at the end of the timeline aren't counted.
+    above = chan_df['taken_slots'].to_numpy() >= from_slots
+    times = chan_df['time'].to_numpy()
 
-    for i in range(len(chan_df)):
-        if chan_df.iloc[i]['taken_slots'] >= from_slots and start_time is None:
-            start_time = chan_df.iloc[i]['time']
-        elif chan_df.iloc[i]['taken_slots'] < from_slots and start_time is not None:
-            cumulative_time_ns += chan_df.iloc[i]['time'] - start_time
-            start_time = None
+    was_above = np.concatenate([[False], above[:-1]])
+    start_times = times[above & ~was_above]
+    end_times = times[~above & was_above]
+
+    cumulative_time_ns = int((end_times - start_times[:len(end_times)]).sum())
 
     # Convert time from nanoseconds to minutes
     cumulative_time_minutes = cumulative_time_ns / (1e9 * 60)
     return cumulative_time_minutes
 
+def slot_duration_curves(all_channel_results, max_slots=MAX_SLOTS):
+    # Computes calculate_cumulative_time for every channel and every threshold from 0 to max_slots in one pass
+    # over slot_timelines' output. Returns the channels (in timeline order) and a (channel, threshold) array of
+    # jam time in minutes.
+    channels = pd.unique(all_channel_results['channel'])
+    rank = pd.Index(channels).get_indexer(all_channel_results['channel'])
+    times = all_channel_results['time'].to_numpy(dtype=np.int64)
+    levels = all_channel_results['taken_slots'].to_numpy()
+    width = max_slots + 1
+
+    # Time spent at each slot count is the gap until the channel's next event. Anything above max_slots counts
+    # towards every threshold, so it's binned with max_slots.
+    last = np.ones(len(rank), dtype=bool)
+    last[:-1] = rank[1:] != rank[:-1]
+    spans = np.zeros(len(rank), dtype=np.int64)
+    spans[:-1] = np.where(last[:-1], 0, times[1:] - times[:-1])
+
+    counted = levels >= 0
+    at_level = np.zeros((len(channels), width), dtype=np.int64)
+    np.add.at(at_level, (rank[counted], np.minimum(levels[counted], max_slots)), spans[counted])
+    at_or_above = np.cumsum(at_level[:, ::-1], axis=1)[:, ::-1]
+
+    # A period that's still running at the end of the timeline isn't counted. For a threshold of k, that period
+    # starts at the first event after which the channel never drops below k again, which we find with a
+    # reversed running minimum of its slot counts. The open period is longest for the lowest threshold, so the
+    # open time at k is the maximum over every level at or above k.
+    suffix_min = pd.Series(levels[::-1]).groupby(rank[::-1]).cummin().to_numpy()[::-1]
+    channel_end = np.zeros(len(channels), dtype=np.int64)
+    channel_end[rank[last]] = times[last]
+
+    rises = (suffix_min >= 0) & ~np.concatenate([[False], (suffix_min[1:] == suffix_min[:-1]) & ~last[:-1]])
+    open_at_level = np.zeros((len(channels), width), dtype=np.int64)
+    np.maximum.at(open_at_level, (rank[rises], np.minimum(suffix_min[rises], max_slots)),
+                  channel_end[rank[rises]] - times[rises])
+    still_open = np.maximum.accumulate(open_at_level[:, ::-1], axis=1)[:, ::-1]
+
+    return channels, (at_or_above - still_open) / (1e9 * 60)
+
+def slot_jam_curve(forwarding_history_file, max_slots=MAX_SLOTS):
+    # Returns get_jam_time for every lower bound from 0 to max_slots, along with the channel that each one was
+    # measured on, from a single pass over the slot timelines. Lower bounds that no channel exceeds have no
+    # channel or jam time.
+    schedule = forwarding_history.pair_schedule(forwarding_history_file)
+    all_channel_results = process_all_channels(schedule)
+    channels, curves = slot_duration_curves(all_channel_results, max_slots)
+
+    # get_jam_time picks the first channel whose peak is above the bound, which we find by searching the running
+    # maximum of peaks.
+    bounds = np.arange(max_slots + 1)
+    peaks = all_channel_results.groupby('channel', sort=False)['taken_slots'].max().reindex(channels).to_numpy()
+    selected = np.searchsorted(np.maximum.accumulate(peaks), bounds, side='right')
+    found = selected < len(channels)
+
+    curve = pd.DataFrame({'slots': bounds, 'channel': pd.NA, 'jam_time_minutes': np.nan})
+    curve['channel'] = curve['channel'].astype('Int64')
+    curve.loc[found, 'channel'] = channels[selected[found]]
+    curve.loc[found, 'jam_time_minutes'] = curves[selected[found], bounds[found]]
+
+    return curve
+
 def create_pair_schedule_df(json_file_path):
-    with open(json_file_path, 'r') as file:
-        data = json.load(file)
-    
-    
-    forwards = data.get('forwards', [])
-    
     # Extract relevant fields
-    rows = []
-    for entry in forwards:
-        if isinstance(entry, dict):
-            rows.append({
-                'eventTimeNs': int(entry['addTimeNs']),
-                'eventType': 'add',
-                'shortChannelId_outgoing': int(entry['outgoingCircuit']['shortChannelId']),
-                'shortChannelId_incoming': int(entry['incomingCircuit']['shortChannelId']),
-            })
-            if 'resolveTimeNs' in entry:
-                rows.append({
-                    'eventTimeNs': int(entry['resolveTimeNs']),
-                    'eventType': 'resolve',
-                    'shortChannelId_outgoing': int(entry['outgoingCircuit']['shortChannelId']),
-                    'shortChannelId_incoming': int(entry['incomingCircuit']['shortChannelId']),
-                })
-        else:
-            print(f"Expected a dictionary but got {type(entry)}.")
-    
-    # Create DataFrame
-    pair_schedule_df = pd.DataFrame(rows)
-    pair_schedule_df = pair_schedule_df.sort_values(by='eventTimeNs').reset_index(drop=True)
-    return pair_schedule_df
+    schedule = forwarding_history.pair_schedule(json_file_path)
+    return schedule.to_frame(['eventTimeNs', 'eventType', 'shortChannelId_outgoing', 'shortChannelId_incoming'])
 
 
 def get_jam_time(forwarding_history_file, lower_bound):
-    pair_schedule_df = create_pair_schedule_df(forwarding_history_file)
+    # Accepts either a forwarding history file or a history that's already been loaded, in which case its
+    # schedule is shared rather than rebuilt.
+    schedule = forwarding_history.pair_schedule(forwarding_history_file)
 
-    if pair_schedule_df is not None:
-        all_channel_results = process_all_channels(pair_schedule_df)
+    if schedule is not None:
+        all_channel_results = process_all_channels(schedule)
         channels_with_high_slots = find_channels_with_high_slots(all_channel_results, lower_bound)
 
         # Assuming there is only one channel with high slots, get the first one
         if channels_with_high_slots:
             selected_channel = channels_with_high_slots[0]
-            chan_df = was_channel_jammed(selected_channel, pair_schedule_df)
+            chan_df = channel_timeline(all_channel_results, selected_channel)
         
             return calculate_cumulative_time(chan_df, lower_bound)
     else:
@@ -1,49 +1,17 @@
 import sys
 import os
+import numpy as np
 import pandas as pd
 import json
+import forwarding_history
+
+# Default grid of liquidity ratios for liquidity_jam_curve.
+LIQUIDITY_RATIOS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
 
 def create_pair_schedule(forwarding_history_json_path):
-    # Load forwarding_history.json
-    with open(forwarding_history_json_path, 'r') as file:
-        forwarding_history_data = json.load(file)
-
-    # Extract the forwarding events
-    forwards = forwarding_history_data.get('forwards', [])
-
-    # Create the initial DataFrame
-    rows = []
-    for entry in forwards:
-        if isinstance(entry, dict):
-            rows.append({
-                'addTimeNs': int(entry['addTimeNs']),
-                'resolveTimeNs': int(entry.get('resolveTimeNs', 0)),
-                'eventTimeNs': int(entry['addTimeNs']),
-                'eventType': 'add',
-                'incomingAmount': int(entry['incomingAmount']),
-                'outgoingAmount': int(entry['outgoingAmount']),
-                'shortChannelId_outgoing': int(entry['outgoingCircuit']['shortChannelId']),
-                'shortChannelId_incoming': int(entry['incomingCircuit']['shortChannelId']),
-            })
-            if 'resolveTimeNs' in entry:
-                rows.append({
-                    'addTimeNs': int(entry['addTimeNs']),
-                    'resolveTimeNs': int(entry['resolveTimeNs']),
-                    'eventTimeNs': int(entry['resolveTimeNs']),
-                    'eventType': 'resolve',
-                    'incomingAmount': int(entry['incomingAmount']),
-                    'outgoingAmount': int(entry['outgoingAmount']),
-                    'shortChannelId_outgoing': int(entry['outgoingCircuit']['shortChannelId']),
-                    'shortChannelId_incoming': int(entry['incomingCircuit']['shortChannelId']),
-                })
-
-    # Create a DataFrame from the rows
-    pair_schedule_df = pd.DataFrame(rows)
-
-    # Sort the DataFrame by eventTimeNs
-    pair_schedule_df = pair_schedule_df.sort_values(by='eventTimeNs').reset_index(drop=True)
-
-    return pair_schedule_df
+    # Read the forwarding events in batches, and build the schedule of add/resolve events sorted by
+    # eventTimeNs. If the history has already been loaded, its schedule is reused.
+    return forwarding_history.pair_schedule(forwarding_history_json_path)
 
 def create_channels_df(channels_json_path):
     # Load channels.json
@@ -58,118 +26,249 @@ def create_channels_df(channels_json_path):
 
     return channels_df
 
-def track_funds(pair_schedule_df, channels_df, jam_lim = 0.2):
-    # Initialize a dictionary to track available funds
-    #funds = {channel: {'incoming': cap // 2, 'outgoing': cap // 2} for channel, cap in zip(channels_df['chan_id'], channels_df['capacity'])}
-    funds = {channel: {'incoming': 0, 'outgoing': 0} for channel, cap in zip(channels_df['chan_id'], channels_df['capacity'])}
-
-    
-    # List to store times when locked funds exceed 80%
-    high_locked_times = []
-    status = []
-    for _, row in pair_schedule_df.iterrows():
-
-        if row['eventType'] == 'add':
-            if row['shortChannelId_incoming'] in funds:
-                funds[row['shortChannelId_incoming']]['outgoing'] += row['incomingAmount']
-            else:
-                # Handle the missing key case, possibly initializing the entry 
-                funds[row['shortChannelId_incoming']] = {'outgoing': row['incomingAmount'], 'incoming': 0}
-            
-            if row['shortChannelId_outgoing'] in funds:
-                funds[row['shortChannelId_outgoing']]['incoming'] += row['outgoingAmount']
-            else:
-                # Handle the missing key case, possibly initializing the entry 
-                funds[row['shortChannelId_outgoing']] = {'incoming': row['outgoingAmount'], 'outgoing': 0}
-
-        elif row['eventType'] == 'resolve':
-            funds[row['shortChannelId_incoming']]['outgoing'] -= row['incomingAmount']
-            funds[row['shortChannelId_outgoing']]['incoming'] -= row['outgoingAmount']
-
-        # Check if the locked amounts exceed 80% of available funds
-        for channel, cap in zip(channels_df['chan_id'], channels_df['capacity']):
-            status.append({
-                    'time': row['eventTimeNs'],
-                    'channel': channel,
-                    'capacity': cap,
-                    'incoming_locked': funds[channel]['incoming'],
-                    'outgoing_locked': funds[channel]['outgoing']
-                })
-            if funds[channel]['incoming'] > jam_lim * (cap // 2):
-                high_locked_times.append({
-                    'time': row['eventTimeNs'],
-                    'resolve_time': row['resolveTimeNs'],
-                    'channel': channel,
-                    'capacity': cap,
-                    'direction': 'incoming',
-                    'funds_locked': funds[channel]['incoming'],
-                })
-            if funds[channel]['outgoing'] > jam_lim * (cap // 2):
-                high_locked_times.append({
-                    'time': row['eventTimeNs'],
-                    'resolve_time': row['resolveTimeNs'],
-                    'channel': channel,
-                    'capacity': cap,
-                    'direction': 'outgoing',
-                    'funds_locked': funds[channel]['outgoing']   
-                })
-
-    return pd.DataFrame(high_locked_times), pd.DataFrame(status)
+def _schedule_arrays(schedule):
+    # Pull the columns that we need out of the schedule once, so that the sweep below works on plain
+    # int64 arrays.
+    sign = schedule.sign
 
-def calculate_active_time(df):
-    # Sort by start time
-    df = df.sort_values(by='time')
-    
-    # Initialize variables
-    total_active_time = 0
-    current_start = None
-    current_end = None
-    
-    for _, row in df.iterrows():
-        start, end = row['time'], row['resolve_time']
-        
-        if current_start is None:
-            current_start = start
-            current_end = end
-        else:
-            if start <= current_end:
-                # Overlapping period, extend the end time if needed
-                current_end = max(current_end, end)
-            else:
-                # Non-overlapping period, add the previous period's duration
-                total_active_time += current_end - current_start
-                current_start = start
-                current_end = end
-    
-    # Add the last period
-    if current_start is not None:
-        total_active_time += current_end - current_start
-    
-    return total_active_time
-
-def is_liquidity_jammed(channels_file, forwarding_history_file, liq_jam_ratio=0.9):
-    channels_df = create_channels_df(channels_file)
-    pair_schedule_df = create_pair_schedule(forwarding_history_file)
+    return {
+        'time': schedule.event_time,
+        'resolve_time': schedule.column('resolve_time'),
+        # Funds locked on the incoming channel of a forward are the outgoing liquidity of that channel, and
+        # funds locked on the outgoing channel are its incoming liquidity.
+        'incoming': (
+            schedule.column('outgoing_scid'),
+            sign * schedule.column('outgoing_amount'),
+        ),
+        'outgoing': (
+            schedule.column('incoming_scid'),
+            sign * schedule.column('incoming_amount'),
+        ),
+    }
+
+def _channel_positions(chan_ids, scids):
+    # Map each scid to its row in channels_df, or -1 if we aren't tracking the channel.
+    positions = np.full(len(scids), -1)
+    if len(chan_ids) == 0:
+        return positions
+
+    sorter = np.argsort(chan_ids, kind='stable')
+    idx = sorter[np.clip(np.searchsorted(chan_ids, scids, sorter=sorter), 0, len(chan_ids) - 1)]
+    matched = chan_ids[idx] == scids
+    positions[matched] = idx[matched]
+
+    return positions
+
+def _locked_runs(scids, deltas, chan_ids, event_count):
+    # Returns the periods over which each tracked channel holds a constant amount of locked funds in one
+    # direction, as (channel position, first event index, end event index, funds locked). The locked amount
+    # only changes on events that touch the channel, so we group those events per channel (keeping time
+    # order) and take a cumulative sum of their signed deltas.
+    positions = _channel_positions(chan_ids, scids)
+    event_idx = np.flatnonzero(positions >= 0)
+    positions = positions[event_idx]
+
+    order = np.argsort(positions, kind='stable')
+    positions = positions[order]
+    event_idx = event_idx[order]
+
+    locked = np.cumsum(deltas[event_idx])
+    group_start = np.ones(len(positions), dtype=bool)
+    group_start[1:] = positions[1:] != positions[:-1]
+    group_offset = np.maximum.accumulate(np.where(group_start, np.arange(len(positions)), 0))
+    locked = locked - (locked[group_offset] - deltas[event_idx][group_offset])
+
+    # Each level holds until the channel's next event, or until the end of the schedule.
+    run_end = np.full(len(positions), event_count)
+    run_end[:-1] = np.where(group_start[1:], event_count, event_idx[1:])
+
+    return positions, event_idx, run_end, locked
+
+def _expand_runs(run_start, run_end):
+    # Expand [start, end) event ranges into the individual event indices they cover.
+    lengths = run_end - run_start
+    total = int(lengths.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(run_start, lengths) + offsets, lengths
+
+def write_status_timeline(schedule, channels_df, status_file, max_cells=1000000):
+    # Writes the locked funds of every channel after every event to status_file as a CSV. This has one row per
+    # channel per event, so we stream it out in chunks of events rather than holding it in memory.
+    events = _schedule_arrays(schedule)
+    chan_ids = channels_df['chan_id'].to_numpy(dtype=np.int64)
+    capacities = channels_df['capacity'].to_numpy(dtype=np.int64)
+    channel_count = len(chan_ids)
+    event_count = len(events['time'])
+
+    in_pos = _channel_positions(chan_ids, events['incoming'][0])
+    out_pos = _channel_positions(chan_ids, events['outgoing'][0])
+
+    incoming_locked = np.zeros(channel_count, dtype=np.int64)
+    outgoing_locked = np.zeros(channel_count, dtype=np.int64)
+
+    chunk_size = max(1, max_cells // max(channel_count, 1))
+    header = True
+    for start in range(0, event_count, chunk_size):
+        end = min(start + chunk_size, event_count)
+        rows = np.arange(end - start)
+
+        chunk_locked = []
+        for positions, deltas, carry in ((in_pos, events['incoming'][1], incoming_locked),
+                                         (out_pos, events['outgoing'][1], outgoing_locked)):
+            chunk = np.zeros((end - start, channel_count), dtype=np.int64)
+            tracked = positions[start:end] >= 0
+            np.add.at(chunk, (rows[tracked], positions[start:end][tracked]), deltas[start:end][tracked])
+            chunk = np.cumsum(chunk, axis=0) + carry
+            carry[:] = chunk[-1]
+            chunk_locked.append(chunk)
+
+        pd.DataFrame({
+            'time': np.repeat(events['time'][start:end], channel_count),
+            'channel': np.tile(chan_ids, end - start),
+            'capacity': np.tile(capacities, end - start),
+            'incoming_locked': chunk_locked[0].ravel(),
+            'outgoing_locked': chunk_locked[1].ravel(),
+        }).to_csv(status_file, mode='w' if header else 'a', header=header, index=False)
+        header = False
+
+def track_funds(schedule, channels_df, jam_lim = 0.2, status_file=None):
+    # Sweeps over the event schedule and reports every (event, channel, direction) where the funds locked in
+    # the channel exceed jam_lim of half of its capacity. If a status_file is provided, the locked funds of
+    # every channel after every event are also written to it.
+    if status_file is not None:
+        write_status_timeline(schedule, channels_df, status_file)
+
+    events = _schedule_arrays(schedule)
+    chan_ids = channels_df['chan_id'].to_numpy(dtype=np.int64)
+    capacities = channels_df['capacity'].to_numpy(dtype=np.int64)
+    limits = jam_lim * (capacities // 2)
+    event_count = len(events['time'])
+
+    high_locked = []
+    for direction_code, direction in enumerate(['incoming', 'outgoing']):
+        scids, deltas = events[direction]
+        positions, run_start, run_end, locked = _locked_runs(scids, deltas, chan_ids, event_count)
+
+        above = locked > limits[positions]
+        event_idx, lengths = _expand_runs(run_start[above], run_end[above])
+        high_locked.append((
+            event_idx,
+            np.repeat(positions[above], lengths),
+            np.full(len(event_idx), direction_code),
+            np.repeat(locked[above], lengths),
+        ))
 
-    high_locked_df, st_df = track_funds(pair_schedule_df, channels_df, liq_jam_ratio)
-    pair_schedule_df.head(10)
+    event_idx, positions, direction_codes, funds_locked = (np.concatenate(cols) for cols in zip(*high_locked))
 
-    grouped = high_locked_df.groupby(['channel', 'direction'])
+    # Order rows by event, then by channel, then by direction to match the order that they're reached when
+    # walking the schedule event by event.
+    order = np.lexsort((direction_codes, positions, event_idx))
+    event_idx = event_idx[order]
+    positions = positions[order]
 
-    results = grouped.apply(calculate_active_time).reset_index()
-    results.columns = ['channel', 'direction', 'total_active_time']
+    return pd.DataFrame({
+        'time': events['time'][event_idx],
+        'resolve_time': events['resolve_time'][event_idx],
+        'channel': chan_ids[positions],
+        'capacity': capacities[positions],
+        'direction': np.array(['incoming', 'outgoing'])[direction_codes[order]],
+        'funds_locked': funds_locked[order],
+    })
+
+def interval_union(groups, starts, ends):
+    # Merges overlapping [start, end] intervals within each group, for all groups at once. Intervals are sorted
+    # by group then start, and an interval begins a new merged interval if it starts after the running maximum
+    # end of the intervals before it in its group. Intervals that end before they start (unresolved forwards have
+    # a resolve_time of 0) are treated as instantaneous.
+    #
+    # Returns the index of the interval that opens each merged interval, and the merged starts and ends, in group
+    # then start order.
+    groups = np.asarray(groups)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.maximum(np.asarray(ends, dtype=np.int64), starts)
+
+    order = np.lexsort((starts, groups))
+    groups, starts, ends = groups[order], starts[order], ends[order]
+    if len(order) == 0:
+        return order, starts, ends
+
+    running_end = pd.Series(ends).groupby(groups).cummax().to_numpy()
+    opens = np.ones(len(order), dtype=bool)
+    opens[1:] = (groups[1:] != groups[:-1]) | (starts[1:] > running_end[:-1])
+    first = np.flatnonzero(opens)
+
+    return order[first], starts[first], np.maximum.reduceat(ends, first)
+
+def merge_active_intervals(df, by=['channel', 'direction']):
+    # Returns the merged [start, end] periods that each group of df was active for, one row per period with the
+    # group's columns followed by start and end.
+    groups = df.groupby(by, sort=True).ngroup().to_numpy()
+    first, starts, ends = interval_union(groups, df['time'], df['resolve_time'])
+
+    merged = df.iloc[first][by].reset_index(drop=True)
+    merged['start'] = starts
+    merged['end'] = ends
+
+    return merged
+
+def calculate_active_times(df, by=['channel', 'direction']):
+    # Returns the total time that each group of df was active for (with overlapping periods only counted once),
+    # in the same order as a sorted groupby, along with the merged periods themselves.
+    merged = merge_active_intervals(df, by)
+    totals = (merged['end'] - merged['start']).groupby([merged[col] for col in by], sort=True).sum()
+
+    return totals.reset_index(name='total_active_time'), merged
+
+def calculate_active_time(df):
+    _, starts, ends = interval_union(np.zeros(len(df), dtype=np.int64), df['time'], df['resolve_time'])
+    return int((ends - starts).sum())
+
+def first_channel_jam_time(high_locked_df):
+    # Reports the active time of the first (channel, direction) in high_locked_df, in minutes.
+    if high_locked_df.empty:
+        return 0
+
+    results, _ = calculate_active_times(high_locked_df)
     results['total_active_time_minutes'] = results['total_active_time']/60000000000
 
     return results['total_active_time_minutes'].tolist()[0]
 
+def is_liquidity_jammed(channels_file, forwarding_history_file, liq_jam_ratio=0.9, status_file=None):
+    channels_df = create_channels_df(channels_file)
+    schedule = create_pair_schedule(forwarding_history_file)
+
+    high_locked_df = track_funds(schedule, channels_df, liq_jam_ratio, status_file)
+    return first_channel_jam_time(high_locked_df)
+
+def liquidity_jam_curve(channels_file, forwarding_history_file, ratios=LIQUIDITY_RATIOS):
+    # Returns is_liquidity_jammed for each of ratios from a single sweep over the schedule. Funds are tracked at
+    # the lowest ratio, and since every row that's above a higher ratio is also above the lowest one, each
+    # ratio's rows are a filter of that result.
+    channels_df = create_channels_df(channels_file)
+    schedule = create_pair_schedule(forwarding_history_file)
+
+    high_locked_df = track_funds(schedule, channels_df, min(ratios))
+    half_capacity = high_locked_df['capacity'] // 2
+
+    return pd.DataFrame({
+        'ratio': ratios,
+        'jam_time_minutes': [
+            first_channel_jam_time(high_locked_df[high_locked_df['funds_locked'] > ratio * half_capacity])
+            for ratio in ratios
+        ],
+    })
+
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print("Usage: python script.py forwarding_history_file channels_file")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python script.py forwarding_history_file channels_file [status_file]")
         sys.exit(1)
 
     forwarding_history_file = sys.argv[1]
     channels_file = sys.argv[2]
 
+    # Optionally write the locked funds of every channel over time to a CSV.
+    status_file = sys.argv[3] if len(sys.argv) == 4 else None
+
     ratio = 0.9
-    jam_time = is_liquidity_jammed(channels_file, forwarding_history_file, ratio)
+    jam_time = is_liquidity_jammed(channels_file, forwarding_history_file, ratio, status_file)
     print(f"Cumulative jam time occupied > 95% of liquidity : {jam_time}")
@@ -0,0 +1,88 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import api_client
+
+class FakeTransport:
+    # Stands in for HttpTransport, recording each request and answering from a table of responses by url.
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None, ssl_context=None):
+        self.requests.append((url, headers, ssl_context))
+        return self.responses[url]
+
+@pytest.fixture
+def macaroon(tmp_path):
+    path = tmp_path / 'admin.macaroon'
+    path.write_bytes(b'\x01\x02\xff')
+    return str(path)
+
+def test_lnd_client(macaroon):
+    transport = FakeTransport({
+        'http://lnd:8080/v1/getinfo': b'{"identity_pubkey": "02aa"}',
+        'http://lnd:8080/v1/payments?include_incomplete=true&index_offset=5&max_payments=10':
+            b'{"payments": [{"payment_index": "6"}], "last_index_offset": "6"}',
+    })
+    client = api_client.LndClient('http://lnd:8080/', macaroon, transport=transport)
+
+    assert client.getinfo() == {'identity_pubkey': '02aa'}
+    assert client.list_payments(5, 10)['last_index_offset'] == '6'
+    assert all(headers == {'Grpc-Metadata-macaroon': '0102ff'} for _, headers, _ in transport.requests)
+
+def test_circuitbreaker_client():
+    transport = FakeTransport({
+        'http://cb:9235/api/forwarding_history': b'{"forwards": []}',
+        'http://cb:9235/api/reputation_thresholds': b'{"htlcs": []}',
+    })
+    client = api_client.CircuitBreakerClient('http://cb:9235', transport)
+
+    assert client.forwarding_history() == b'{"forwards": []}'
+    assert client.reputation_thresholds() == b'{"htlcs": []}'
+
+def test_load_endpoints_shares_transport(tmp_path, macaroon):
+    path = tmp_path / 'endpoints.json'
+    path.write_text(json.dumps({
+        'target': {'lnd': {'url': 'http://lnd:8080', 'macaroon': macaroon}, 'circuitbreaker': 'http://cb:9235'},
+    }))
+    transport = FakeTransport({})
+
+    endpoints = api_client.load_endpoints(str(path), transport)
+
+    assert endpoints['target_lnd'].transport is transport
+    assert endpoints['target_circuitbreaker'].transport is transport
+    assert endpoints['attackers'] == []
+
+def test_http_transport_reuses_connections():
+    connections = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            connections.add(self.client_address)
+            status, body = (200, b'ok') if self.path == '/ok' else (500, b'broken')
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        transport = api_client.HttpTransport(timeout=5)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        assert [transport.get(f"{url}/ok") for _ in range(3)] == [b'ok'] * 3
+        assert len(connections) == 1
+
+        with pytest.raises(RuntimeError):
+            transport.get(f"{url}/broken")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import forwarding_history
+import jam_windows
+
+MINUTE_NS = 60 * 10**9
+
+JAMMED_SCID = 1
+OTHER_SCID = 2
+PEER_SCID = 3
+
+def _forwards(rows):
+    # rows are (add_time, resolve_time or None, incoming_scid, outgoing_scid, amount).
+    columns = {name: [] for name in forwarding_history.FORWARD_COLUMNS}
+    for index, (add_time, resolve_time, incoming_scid, outgoing_scid, amount) in enumerate(rows):
+        columns['add_time'].append(add_time)
+        columns['resolve_time'].append(resolve_time or 0)
+        columns['resolved'].append(resolve_time is not None)
+        columns['incoming_amount'].append(amount + 1000)
+        columns['outgoing_amount'].append(amount)
+        columns['incoming_scid'].append(incoming_scid)
+        columns['outgoing_scid'].append(outgoing_scid)
+        columns['incoming_htlc_index'].append(index)
+        columns['outgoing_htlc_index'].append(index)
+        columns['settled'].append(resolve_time is not None)
+
+    return {name: np.array(values, dtype=dtype)
+            for (name, dtype), values in zip(forwarding_history.FORWARD_COLUMNS.items(), columns.values())}
+
+def _schedule():
+    # JAMMED_SCID has its 3 slots (and its outgoing liquidity) taken by minute 2 and is never freed, so it has
+    # no events after that. Forwards keep flowing between PEER_SCID and OTHER_SCID until minute 120.
+    rows = [(minute * MINUTE_NS, None, PEER_SCID, JAMMED_SCID, 400_000) for minute in range(3)]
+    rows += [(minute * MINUTE_NS, (minute + 10) * MINUTE_NS, PEER_SCID, OTHER_SCID, 1000)
+             for minute in range(0, 120, 10)]
+    return forwarding_history.event_schedule(_forwards(rows))
+
+def _channels():
+    return pd.DataFrame({'chan_id': [JAMMED_SCID, OTHER_SCID, PEER_SCID],
+                         'capacity': [2_000_000, 10**9, 10**9]})
+
+def _jammed(windows):
+    return windows[windows['channel'] == JAMMED_SCID].set_index('criterion')
+
+def test_open_windows_run_until_the_last_event():
+    windows = _jammed(jam_windows.schedule_windows(_schedule(), _channels(), lower_bound=3, liq_jam_ratio=0.9))
+
+    for criterion in ['slots', 'liquidity']:
+        window = windows.loc[criterion]
+        assert window['open']
+        assert window['start'] == 2 * MINUTE_NS
+        assert window['end'] == 120 * MINUTE_NS
+        assert window['duration_minutes'] == 118
+
+def test_open_windows_run_until_end_time():
+    windows = _jammed(jam_windows.schedule_windows(_schedule(), _channels(), lower_bound=3, liq_jam_ratio=0.9,
+                                                   end_time=180 * MINUTE_NS))
+
+    assert list(windows['end']) == [180 * MINUTE_NS] * 2
+    assert jam_windows.summarize_windows(windows.reset_index())['goal_met_ns'] == 62 * MINUTE_NS
@@ -0,0 +1,112 @@
+import json
+import numpy as np
+import pandas as pd
+import cache
+
+def read_htlc_batches(file_path):
+    # Reads the htlcs of circuitbreaker's reputation_thresholds output into columns. Outcomes that are missing
+    # from an htlc are stored as -1.
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+
+    htlcs = data.get('htlcs', [])
+
+    yield {
+        'forward_ts': np.array([int(htlc.get('forwardTsNs', 0)) for htlc in htlcs], dtype=np.int64),
+        'outcome': np.array([int(htlc.get('outcome', -1)) for htlc in htlcs], dtype=np.int8),
+        'outgoing_channel': np.array([int(htlc.get('outgoingChannel', 0)) for htlc in htlcs], dtype=np.int64),
+        'incoming_channel': np.array([int(htlc.get('incomingChannel', 0)) for htlc in htlcs], dtype=np.int64),
+    }
+
+def load_htlcs(file_path):
+    # Loads the htlcs in a thresholds file as columns, using the on-disk cache so that only the first read of a
+    # file parses its JSON.
+    return cache.load_columns(file_path, 'htlcs', read_htlc_batches)
+
+# Reputation outcomes reported by circuitbreaker for each htlc, by their value in the outcome column.
+OUTCOMES = {
+    0: 'dropped_no_resources',
+    1: 'forwarded_unendorsed',
+    2: 'forwarded_endorsed',
+    3: 'dropped_unknown_outgoing',
+}
+
+def outcome_columns(outcome):
+    # Maps each htlc's outcome to its column in outcome counts: 0 for htlcs without an outcome, or with one
+    # that isn't in OUTCOMES, and outcome + 1 otherwise.
+    outcome = np.asarray(outcome).astype(np.int64)
+    return np.where((outcome >= 0) & (outcome < len(OUTCOMES)), outcome + 1, 0)
+
+# Channel columns that the index groups htlcs by.
+INDEX_DIRECTIONS = {
+    'outgoing': 'outgoing_channel',
+    'incoming': 'incoming_channel',
+}
+
+def read_channel_index_batches(file_path):
+    # Builds a per-channel index of a thresholds file's htlcs, in each direction, so that a channel's htlcs over
+    # any time range are a binary search rather than a scan of every htlc. For each direction, htlcs are grouped
+    # by channel ({direction}_channels[i]'s rows are {direction}_start[i]:{direction}_start[i+1]) and sorted by
+    # forward time within each channel. Each channel's count of every outcome is kept too, laid out as in
+    # outcome_columns.
+    htlcs = load_htlcs(file_path)
+    forward_ts = np.asarray(htlcs['forward_ts'])
+    outcome = np.asarray(htlcs['outcome'])
+
+    batch = {}
+    for direction, column in INDEX_DIRECTIONS.items():
+        channels, channel_id = np.unique(np.asarray(htlcs[column]), return_inverse=True)
+        order = np.lexsort((forward_ts, channel_id))
+
+        counts = np.zeros((len(channels), len(OUTCOMES) + 1), dtype=np.int64)
+        np.add.at(counts, (channel_id, outcome_columns(outcome)), 1)
+
+        batch[f'{direction}_channels'] = channels.astype(np.int64)
+        batch[f'{direction}_start'] = np.searchsorted(channel_id[order], np.arange(len(channels) + 1)).astype(np.int64)
+        batch[f'{direction}_forward_ts'] = forward_ts[order]
+        batch[f'{direction}_outcome'] = outcome[order]
+        batch[f'{direction}_outcome_counts'] = counts.ravel()
+
+    yield batch
+
+def load_channel_index(file_path):
+    # The index is built from the cached htlc columns, and cached itself, so the JSON is only parsed once and
+    # the index only sorted once for each version of the file.
+    return cache.load_columns(file_path, 'htlc_channel_index', read_channel_index_batches)
+
+def channel_rows(index, scid, direction='outgoing', start_ns=None, end_ns=None):
+    # Returns the range of rows in the index for scid's htlcs in direction, optionally limited to htlcs
+    # forwarded from start_ns up to and including end_ns.
+    channels = index[f'{direction}_channels']
+    position = int(np.searchsorted(channels, scid))
+    if position == len(channels) or channels[position] != scid:
+        return 0, 0
+
+    first = int(index[f'{direction}_start'][position])
+    last = int(index[f'{direction}_start'][position + 1])
+    forward_ts = index[f'{direction}_forward_ts'][first:last]
+
+    if end_ns is not None:
+        last = first + int(np.searchsorted(forward_ts, end_ns, side='right'))
+    if start_ns is not None:
+        first = first + int(np.searchsorted(forward_ts, start_ns, side='left'))
+
+    return first, max(first, last)
+
+def channel_htlcs(index, scid, direction='outgoing', start_ns=None, end_ns=None):
+    # Returns the forward times and outcomes of scid's htlcs in direction, sorted by forward time.
+    first, last = channel_rows(index, scid, direction, start_ns, end_ns)
+    return index[f'{direction}_forward_ts'][first:last], index[f'{direction}_outcome'][first:last]
+
+def channel_outcome_counts(index, direction='outgoing'):
+    # Returns the number of htlcs and the count of each outcome for every channel in direction. Htlcs without
+    # a recognised outcome are counted as unknown.
+    channels = index[f'{direction}_channels']
+    counts = index[f'{direction}_outcome_counts'].reshape(len(channels), len(OUTCOMES) + 1)
+
+    return pd.DataFrame({
+        'channel': channels,
+        'htlcs': counts.sum(axis=1),
+        **{name: counts[:, outcome + 1] for outcome, name in OUTCOMES.items()},
+        'unknown': counts[:, 0],
+    })
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import analyse_attack
+import api_client
+import forwarding_history
+import target_liquidity_jammed
+
+def new_watch_state(channels_df):
+    # State that's kept between polls: the forwards that we've seen added but not resolved, and the slots and
+    # liquidity that they hold on each channel. Liquidity is tracked the same way as track_funds: the outgoing
+    # amount is locked on the outgoing channel's incoming side, and the incoming amount on the incoming channel's
+    # outgoing side.
+    return {
+        'capacities': dict(zip(channels_df['chan_id'].tolist(), channels_df['capacity'].tolist())),
+        'in_flight': {},
+        'slots': {},
+        'locked': {'incoming': {}, 'outgoing': {}},
+        'jammed_since': {},
+        'htlc_outcomes': {},
+        # Where the forwards that were pending at the last poll are in the downloaded history (start, end, key),
+        # and where the last forward ended, along with the text just before that which won't change.
+        'history_pending': [],
+        'history_end': None,
+        'history_marker': '',
+    }
+
+def _forward_key(entry):
+    return (int(entry['incomingCircuit']['shortChannelId']), int(entry['incomingCircuit']['htlcIndex']))
+
+def _apply(state, forward, sign):
+    incoming_scid, outgoing_scid, incoming_amount, outgoing_amount, _ = forward
+
+    # A forward only takes one slot if it comes in and goes out on the same channel.
+    for scid in {incoming_scid, outgoing_scid}:
+        state['slots'][scid] = state['slots'].get(scid, 0) + sign
+
+    for direction, scid, amount in (('incoming', outgoing_scid, outgoing_amount),
+                                    ('outgoing', incoming_scid, incoming_amount)):
+        locked = state['locked'][direction]
+        locked[scid] = locked.get(scid, 0) + sign * amount
+
+def _decode_entries(history, pos):
+    # Decodes the forwards of a downloaded history from pos to the end of its forwards array, returning each
+    # one's start, end and value, along with the end of the last one (or pos if there aren't any).
+    decoder = json.JSONDecoder()
+    entries = []
+    last_end = pos
+    while True:
+        while pos < len(history) and history[pos] in ' \t\r\n,':
+            pos += 1
+
+        if pos == len(history):
+            raise ValueError("Unexpected end of file in forwards array")
+        if history[pos] == ']':
+            return entries, last_end
+
+        entry, end = decoder.raw_decode(history, pos)
+        entries.append((pos, end, entry))
+        pos = last_end = end
+
+def _pending_since(state, history):
+    # Re-decodes only the forwards that were pending at the last poll, and any that have been added since.
+    # Everything else in the history is the same text as last time, shifted along by however much the pending
+    # forwards' text has grown as they've resolved. Returns None if the history doesn't line up with the last
+    # one, eg if circuitbreaker has restarted.
+    decoder = json.JSONDecoder()
+    shift = 0
+    entries = []
+    for start, end, key in state['history_pending']:
+        try:
+            entry, new_end = decoder.raw_decode(history, start + shift)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(entry, dict) or _forward_key(entry) != tuple(key):
+            return None
+
+        entries.append((start + shift, new_end, entry))
+        shift += (new_end - start - shift) - (end - start)
+
+    marker = state['history_marker']
+    entries_end = state['history_end'] + shift
+    if history[entries_end - len(marker):entries_end] != marker or history[entries_end:entries_end + 1] not in ' \t\r\n,]':
+        return None
+
+    added, entries_end = _decode_entries(history, entries_end)
+    return entries + added, entries_end
+
+def new_forward_entries(state, history):
+    # Circuitbreaker returns the full forwarding history on every poll. Forwards that had resolved by the last
+    # poll don't change, so rather than decoding the whole history again, only the forwards that were still
+    # pending and any new ones are decoded. The first poll (or one that doesn't line up with the last) decodes
+    # everything.
+    decoded = _pending_since(state, history) if state['history_end'] is not None else None
+    if decoded is None:
+        match = forwarding_history.FORWARDS_START.search(history)
+        if match is None:
+            raise ValueError("No forwards array in forwarding history")
+        decoded = _decode_entries(history, match.end())
+
+    entries, entries_end = decoded
+    state['history_pending'] = [(start, end, _forward_key(entry)) for start, end, entry in entries
+                                if isinstance(entry, dict) and 'resolveTimeNs' not in entry]
+    state['history_end'] = entries_end
+
+    # The text just before the end of the last forward, back to the last pending forward (whose text will change).
+    last_pending_end = state['history_pending'][-1][1] if state['history_pending'] else 0
+    state['history_marker'] = history[max(entries_end - 64, last_pending_end):entries_end]
+
+    return [entry for _, _, entry in entries]
+
+def fold_forwards(state, entries):
+    # Folds a fresh copy of circuitbreaker's forwarding history into state. Forwards that we haven't seen before
+    # are added if they're still in flight, and in-flight forwards that have since resolved are removed. Anything
+    # that was added and resolved between polls never held any resources that we could see, so it's skipped.
+    # Returns the number of forwards added and resolved.
+    added = resolved = 0
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+
+        key = _forward_key(entry)
+        if 'resolveTimeNs' in entry:
+            forward = state['in_flight'].pop(key, None)
+            if forward is not None:
+                _apply(state, forward, -1)
+                resolved += 1
+        elif key not in state['in_flight']:
+            forward = (
+                int(entry['incomingCircuit']['shortChannelId']),
+                int(entry['outgoingCircuit']['shortChannelId']),
+                int(entry['incomingAmount']),
+                int(entry['outgoingAmount']),
+                int(entry['addTimeNs']),
+            )
+            state['in_flight'][key] = forward
+            _apply(state, forward, 1)
+            added += 1
+
+    return added, resolved
+
+def fold_thresholds(state, thresholds):
+    # Keeps the latest count of htlcs for each outcome reported by circuitbreaker's reputation thresholds.
+    outcomes = {}
+    for htlc in thresholds.get('htlcs', []):
+        outcome = int(htlc.get('outcome', -1))
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    state['htlc_outcomes'] = outcomes
+
+def _holds(jam, forward):
+    # Returns how much of a jam's resource a forward holds: a slot, or the amount that it locks in the jam's
+    # direction.
+    criterion, scid = jam
+    incoming_scid, outgoing_scid, incoming_amount, outgoing_amount, _ = forward
+
+    if criterion == 'slots':
+        return 1 if scid in (incoming_scid, outgoing_scid) else 0
+    if criterion == 'incoming':
+        return outgoing_amount if outgoing_scid == scid else 0
+    return incoming_amount if incoming_scid == scid else 0
+
+def jam_start(state, jam, is_over):
+    # Returns the add time of the in-flight forward that pushed a jammed channel over its limit, found by adding
+    # up what each forward holds in the order that they were added until is_over(total) holds. Forwards that
+    # have already resolved can't be seen, so this is when the htlcs that are jamming the channel now did so.
+    held = sorted((forward[4], _holds(jam, forward)) for forward in state['in_flight'].values())
+
+    total = 0
+    for add_time_ns, amount in held:
+        if amount == 0:
+            continue
+        total += amount
+        if is_over(total):
+            return add_time_ns
+
+    return None
+
+def update_jams(state, now_ns, lower_bound=440, liq_jam_ratio=0.9):
+    # Marks each channel as jammed (by slots, or by liquidity in either direction) using the same limits as
+    # calculate_cumulative_time and track_funds. Each jam is timed from the add time of the forward that pushed
+    # its channel over the limit, so jams that were already running when we started watching (or started between
+    # polls) get their full duration. Returns the current jams, with how long each has been running in minutes.
+    jammed = {}
+    for scid, slots in state['slots'].items():
+        if slots >= lower_bound:
+            jammed[('slots', scid)] = lambda total: total >= lower_bound
+
+    for direction, locked in state['locked'].items():
+        for scid, amount in locked.items():
+            capacity = state['capacities'].get(scid)
+            if capacity is not None and amount > liq_jam_ratio * (capacity // 2):
+                jammed[(direction, scid)] = lambda total, capacity=capacity: total > liq_jam_ratio * (capacity // 2)
+
+    jammed_since = state['jammed_since']
+    for jam in list(jammed_since):
+        if jam not in jammed:
+            del jammed_since[jam]
+    for jam, is_over in jammed.items():
+        if jam not in jammed_since:
+            since = jam_start(state, jam, is_over)
+            jammed_since[jam] = since if since is not None else now_ns
+
+    return {jam: (now_ns - since) / (1e9 * 60) for jam, since in jammed_since.items()}
+
+def print_status(state, jams, added, resolved):
+    print(f"[{time.strftime('%H:%M:%S')}] {len(state['in_flight'])} htlcs in flight (+{added}, -{resolved})")
+
+    for scid in sorted(state['capacities']):
+        slots = state['slots'].get(scid, 0)
+        capacity = state['capacities'][scid] // 2
+        incoming = state['locked']['incoming'].get(scid, 0)
+        outgoing = state['locked']['outgoing'].get(scid, 0)
+        if slots == 0 and incoming == 0 and outgoing == 0:
+            continue
+
+        print(f"  {scid}: {slots} slots, incoming {round(incoming * 100 / capacity, 1) if capacity else 0}%, "
+              f"outgoing {round(outgoing * 100 / capacity, 1) if capacity else 0}% locked")
+
+    for (criterion, scid), minutes in sorted(jams.items(), key=lambda jam: -jam[1]):
+        print(f"  JAMMED {scid} ({criterion}) for {round(minutes, 2)} minutes")
+
+    if state['htlc_outcomes']:
+        print(f"  Htlcs dropped no resources: {state['htlc_outcomes'].get(0, 0)}, "
+              f"dropped unknown outgoing: {state['htlc_outcomes'].get(3, 0)}")
+
+    sys.stdout.flush()
+
+def _download(save, padded_node_id, client_call):
+    # Fetches a circuitbreaker endpoint through the API client if we have one, otherwise through kubectl.
+    if client_call is not None:
+        return client_call().decode('utf-8')
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        if save(padded_node_id, path) != 0:
+            raise RuntimeError("Failed to pull from circuitbreaker")
+        with open(path, 'r') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+def watch(padded_node_id, interval_secs, lower_bound=440, liq_jam_ratio=0.9, endpoints=None):
+    endpoints = endpoints or {}
+    circuitbreaker = endpoints.get('target_circuitbreaker')
+
+    fd, channel_file = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        analyse_attack.save_channel_list(padded_node_id, channel_file, endpoints.get('target_lnd'))
+        state = new_watch_state(target_liquidity_jammed.create_channels_df(channel_file))
+    finally:
+        os.remove(channel_file)
+
+    while True:
+        history = _download(analyse_attack.save_forwarding_history, padded_node_id,
+                            circuitbreaker.forwarding_history if circuitbreaker else None)
+        added, resolved = fold_forwards(state, new_forward_entries(state, history))
+
+        thresholds = _download(analyse_attack.save_thresholds, padded_node_id,
+                               circuitbreaker.reputation_thresholds if circuitbreaker else None)
+        fold_thresholds(state, json.loads(thresholds))
+
+        jams = update_jams(state, time.time_ns(), lower_bound, liq_jam_ratio)
+        print_status(state, jams, added, resolved)
+
+        time.sleep(interval_secs)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch the slots and liquidity of a network's target node while an attack runs.")
+    parser.add_argument("network_name")
+    parser.add_argument("--interval", type=float, default=30, help="seconds between polls")
+    parser.add_argument("--slots", type=int, default=440, help="slots taken for a channel to count as jammed")
+    parser.add_argument("--ratio", type=float, default=0.9, help="share of liquidity locked for a channel to count as jammed")
+    parser.add_argument("--endpoints", help="json file with LND/circuitbreaker API endpoints to use instead of kubectl (see api_client.load_endpoints)")
+    args = parser.parse_args()
+
+    file_path = os.path.join("data", args.network_name, "target.txt")
+    if not os.path.exists(file_path):
+        print(f"The network at {file_path} does not exist.")
+        sys.exit(1)
+
+    with open(file_path, 'r') as file:
+        node_id = file.read().strip()
+
+    endpoints = api_client.load_endpoints(args.endpoints) if args.endpoints else None
+
+    try:
+        watch(node_id.zfill(6), args.interval, args.slots, args.ratio, endpoints)
+    except KeyboardInterrupt:
+        pass
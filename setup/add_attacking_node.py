@@ -1,84 +1,74 @@
-import sys
+import argparse
+import copy
+import itertools
 import os
 import json
 
-def candidate_nodes(source_data, target):
+# Any unique pubkey will do for the attacker, because the network's keys are replaced when it's created.
+ATTACKER_PUBKEY = "035a43121d24b2ff465e85af9c07963701f259b5ce4ee636e3aeb503cc64142c11"
+
+DEFAULT_CHANNEL_CAPACITY = 10000000
+
+# Ways that candidate nodes can be ranked, best first.
+RANKINGS = {
+    'capacity': lambda index, node: index['capacity'][node],
+    'degree': lambda index, node: index['degree'][node],
+}
+
+def graph_nodes(source_data):
     # Assuming source_data is a list or dictionary containing nodes
     if isinstance(source_data, dict):
-        nodes = source_data.get('nodes', [])  # Adjust key based on your JSON structure
+        return source_data.get('nodes', [])  # Adjust key based on your JSON structure
     elif isinstance(source_data, list):
-        nodes = source_data
-    else:
-        nodes = []
-    node_capacity = {node['pub_key']: 0 for node in nodes}
+        return source_data
+    return []
 
-    # Set to store nodes that are connected to the target
-    connected_to_target = set()
+def index_graph(source_data):
+    # Computes each node's total channel capacity, peers and channel count in a single pass over the edges, so
+    # that any number of attacker layouts can be built from one parse of the graph.
+    pubkeys = [node['pub_key'] for node in graph_nodes(source_data)]
+    capacity = {pubkey: 0 for pubkey in pubkeys}
+    peers = {pubkey: set() for pubkey in pubkeys}
+    degree = {pubkey: 0 for pubkey in pubkeys}
 
-    # Calculate total capacities and find nodes connected to the target
     for edge in source_data.get('edges'):
         node1 = edge['node1_pub']
         node2 = edge['node2_pub']
-        capacity = int(edge['capacity'])
-
-        # Increment capacity for both nodes
-        node_capacity[node1] += capacity
-        node_capacity[node2] += capacity
-
-        # Check if either node is connected to the target
-        if target in (node1, node2):
-            connected_to_target.add(node1)
-            connected_to_target.add(node2)
-
-    # Create a list of node pubkeys not connected to the target
-    filtered_nodes = [node for node in node_capacity if node not in connected_to_target]
-
-    # Sort the nodes by their total edge capacity in descending order
-    sorted_nodes = sorted(filtered_nodes, key=lambda node: node_capacity[node], reverse=True)
-
-    return sorted_nodes
-
-if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python add_attacking_node.py source_network_name target_pubkey output_network")
-        sys.exit(1)
-
-    source_network_name = sys.argv[1]
-    current_directory = os.getcwd()
-    sim_files = os.path.join(current_directory, "attackathon", "data", source_network_name)
-    source_graph = os.path.join(sim_files, f"{source_network_name}.json")
+        edge_capacity = int(edge['capacity'])
+
+        for node, peer in ((node1, node2), (node2, node1)):
+            capacity[node] += edge_capacity
+            peers[node].add(peer)
+            degree[node] += 1
+
+    return {
+        'pubkeys': pubkeys,
+        'alias': {pubkey: i for i, pubkey in enumerate(pubkeys)},
+        'capacity': capacity,
+        'peers': peers,
+        'degree': degree,
+    }
 
-    # Get target node for the reference network.
-    source_target = sys.argv[2]
+def candidate_nodes(source_data, target, ranking='capacity', index=None):
+    # Returns the nodes that aren't connected to the target (or the target itself), best first by ranking.
+    if index is None:
+        index = index_graph(source_data)
 
-    # Get candidate nodes that aren't connected to our target.
-    with open(source_graph, 'r') as f:
-        source_data = json.load(f)
+    excluded = index['peers'].get(target, set())
+    if excluded:
+        excluded = excluded | {target}
 
-    # Get total count of nodes in the network, and nodes that aren't connected to target.
-    node_count = len(source_data.get('nodes'))
-    candidate_nodes = candidate_nodes(source_data, source_target)
+    filtered_nodes = [node for node in index['pubkeys'] if node not in excluded]
 
-    # Create 10% of the channels in the network for the attacker.
-    channel_count = int(node_count / 10)
-    print(f"Graph size: {node_count}, with {len(candidate_nodes)} candidates not connected to target {source_target}, adding {channel_count}.")
+    # Sort the nodes by their rank in descending order
+    rank = RANKINGS[ranking]
+    return sorted(filtered_nodes, key=lambda node: rank(index, node), reverse=True)
 
-    # Insert the target node into the json, these values don't matter because we replace them, we just need a unique pubkey.
-    attacker_pubkey = "035a43121d24b2ff465e85af9c07963701f259b5ce4ee636e3aeb503cc64142c11"
-    new_node = {
-        "pub_key": attacker_pubkey,
-        "alias": "attacker"
-    }
-
-    nodes = source_data.get('nodes', [])
-    nodes.append(new_node)
-    source_data['nodes'] = nodes
-
-    channel_capacity = 10000000
+def base_edge(channel_capacity):
+    # Creates a base edge where node 1 has zero fees (the attacker).
     max_htlc_msat = (channel_capacity - 1000) *1000
 
-    # Create a base edge where node 1 has zero fees (the attacker).
-    base_edge = {
+    return {
         "node1_pub": "",
         "node2_pub": "",
         "channel_id": "912080079760850944",
@@ -98,40 +88,100 @@ if __name__ == "__main__":
             "max_htlc_msat": max_htlc_msat,
         },
     }
-    
-    edges = source_data.get('edges', [])
-    for i in range(channel_count):
-        node = nodes[i]
-        edge = base_edge.copy()
+
+def attacker_edges(candidates, target, channel_count, channel_capacity):
+    # Creates channels between the attacker and the first channel_count candidates, and a single channel with
+    # the target that's as large as all of them combined. Each edge gets its own copy of the base edge's
+    # policies, so they can be changed independently.
+    template = base_edge(channel_capacity)
+
+    edges = []
+    for i, node in enumerate(candidates[:channel_count]):
+        edge = copy.deepcopy(template)
 
         # Set node 1 to the attacker and node 2 to the candidate node.
-        edge['node1_pub'] = attacker_pubkey
-        edge['node2_pub'] = node['pub_key']
+        edge['node1_pub'] = ATTACKER_PUBKEY
+        edge['node2_pub'] = node
         edge['channel_id'] = i + 1
-
-        # Append the new edge to the edges list
         edges.append(edge)
 
-    # Now add a single channel between the target node and the attacker.
-    edge = base_edge.copy()
-
-    # Set node 1 to the attacker and node 2 to the candidate node.
-    edge['node1_pub'] = attacker_pubkey
-    edge['node2_pub'] = source_target
+    # Now add a single channel between the target node and the attacker. Only its capacity is combined, its
+    # policies keep the same per-channel max_htlc as the other edges.
+    edge = base_edge(channel_capacity)
+    edge['capacity'] = channel_capacity * len(edges)
+    edge['node1_pub'] = ATTACKER_PUBKEY
+    edge['node2_pub'] = target
     edge['channel_id'] = 999
-    edge['capacity'] = channel_capacity * channel_count
-
-    # Append the new edge to the edges list
     edges.append(edge)
 
-    # Update the data with new edges
-    source_data['edges'] = edges
-
-    # Save modified graph
-    dest_network_name = sys.argv[3]
-    sim_files = os.path.join(current_directory, "attackathon", "data", dest_network_name)
-    dest_graph = os.path.join(sim_files, f"{dest_network_name}.json")
-   
-    # Save the modified JSON data back to the file
-    with open(dest_graph, 'w') as f:
-        json.dump(source_data, f, indent=4)
+    return edges
+
+def attacker_graph(source_data, edges):
+    # Returns a copy of the source graph with the attacker and its edges added, leaving source_data untouched so
+    # that it can be reused for other layouts.
+    graph = dict(source_data)
+    graph['nodes'] = graph_nodes(source_data) + [{"pub_key": ATTACKER_PUBKEY, "alias": "attacker"}]
+    graph['edges'] = source_data.get('edges', []) + edges
+    return graph
+
+def write_network(data_dir, network_name, graph, target_alias, attacker_alias):
+    sim_files = os.path.join(data_dir, network_name)
+    os.makedirs(sim_files, exist_ok=True)
+
+    # Save the modified JSON data, along with the aliases of the target and attacker.
+    with open(os.path.join(sim_files, f"{network_name}.json"), 'w') as f:
+        json.dump(graph, f, indent=4)
+
+    for file_name, alias in (("target.txt", target_alias), ("attacker.txt", attacker_alias)):
+        with open(os.path.join(sim_files, file_name), 'w') as f:
+            f.write(f"{alias}\n")
+
+def generate_variants(source_data, target, dest_network_name, data_dir, channel_counts, channel_capacities, rankings):
+    # Writes one network for every combination of channel count, capacity and candidate ranking, indexing the
+    # source graph once for all of them. A single combination is written to dest_network_name, otherwise each
+    # variant's name describes its layout. Returns the names of the networks written.
+    index = index_graph(source_data)
+    candidates = {ranking: candidate_nodes(source_data, target, ranking, index) for ranking in rankings}
+
+    variants = list(itertools.product(channel_counts, channel_capacities, rankings))
+    written = []
+    for channel_count, channel_capacity, ranking in variants:
+        name = dest_network_name
+        if len(variants) > 1:
+            name = f"{dest_network_name}_{ranking}_{channel_count}x{channel_capacity}"
+
+        edges = attacker_edges(candidates[ranking], target, channel_count, channel_capacity)
+        write_network(data_dir, name, attacker_graph(source_data, edges), index['alias'].get(target),
+                      len(index['pubkeys']))
+
+        print(f"Wrote {name}: {min(channel_count, len(candidates[ranking]))} channels of {channel_capacity} sats "
+              f"to candidates ranked by {ranking}")
+        written.append(name)
+
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add an attacking node to a network's graph.")
+    parser.add_argument("source_network_name")
+    parser.add_argument("target_pubkey")
+    parser.add_argument("output_network")
+    parser.add_argument("--channel-counts", type=int, nargs="+", help="channels to open with candidates, defaults to 10%% of the graph's node count")
+    parser.add_argument("--capacities", type=int, nargs="+", default=[DEFAULT_CHANNEL_CAPACITY], help="capacity of each candidate channel in sats")
+    parser.add_argument("--rankings", nargs="+", choices=list(RANKINGS), default=['capacity'], help="how to choose candidate nodes")
+    args = parser.parse_args()
+
+    current_directory = os.getcwd()
+    data_dir = os.path.join(current_directory, "attackathon", "data")
+    source_graph = os.path.join(data_dir, args.source_network_name, f"{args.source_network_name}.json")
+
+    with open(source_graph, 'r') as f:
+        source_data = json.load(f)
+
+    # Get total count of nodes in the network. By default, we create 10% of the channels in the network for the
+    # attacker.
+    node_count = len(source_data.get('nodes'))
+    channel_counts = args.channel_counts or [int(node_count / 10)]
+    print(f"Graph size: {node_count}, adding attacker targeting {args.target_pubkey}.")
+
+    generate_variants(source_data, args.target_pubkey, args.output_network, data_dir, channel_counts,
+                      args.capacities, args.rankings)
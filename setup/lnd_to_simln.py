@@ -1,81 +1,176 @@
 import json
 import sys
 
-def convert_to_sim_network(input_file, output_file):
-    with open(input_file, 'r') as f:
-        data = json.load(f)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps_indented(value):
+    # Formats value the same way as json.dump(indent=2), using orjson if it's installed.
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(value, indent=2)
+
+def iter_array_items(file, read_size=1 << 20):
+    # Incrementally reads a JSON object whose values are arrays (like describegraph's {"nodes": [...], "edges":
+    # [...]}), yielding (key, item) for each item of each array. Only the current item and a read buffer are
+    # held in memory. Values that aren't arrays are skipped.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = file.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip(chars):
+        # Skips over chars, reading more as needed. Returns the next character, or None at the end of the file.
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                return None
+            fill()
+
+    def decode():
+        # Decodes the next value, reading more until it's complete.
+        nonlocal pos
+        while True:
+            try:
+                value, pos = decoder.raw_decode(buffer, pos)
+                return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+
+    if skip(' \t\r\n') != '{':
+        raise ValueError("Expected a JSON object")
+    pos += 1
+
+    while skip(' \t\r\n,') not in ('}', None):
+        key = decode()
+        skip(' \t\r\n')
+        pos += 1  # Skip the colon
+
+        if skip(' \t\r\n') != '[':
+            decode()
+            continue
+        pos += 1
 
-    nodes = data.get('nodes', [])
-    node_pubkey_index = {node['pub_key']: index for index, node in enumerate(nodes)}
+        while skip(' \t\r\n,') != ']':
+            yield key, decode()
+        pos += 1
 
-    sim_network = []
+def read_graph(input_file):
+    # Reads the pubkeys of the graph's nodes, and the fields of each edge that we need for conversion, without
+    # holding the full graph in memory. Edges that are missing a policy are counted rather than kept.
+    node_pubkey_index = {}
+    node_count = 0
+    edges = []
+    skipped = []
+
+    with open(input_file, 'r') as f:
+        for key, item in iter_array_items(f):
+            if key == 'nodes':
+                node_pubkey_index[item['pub_key']] = node_count
+                node_count += 1
+            elif key == 'edges':
+                node_1_policy = item.get('node1_policy', None)
+                node_2_policy = item.get('node2_policy', None)
+
+                if not node_1_policy or not node_2_policy:
+                    skipped.append(int(item['channel_id']))
+                    continue
+
+                edges.append((
+                    int(item['channel_id']),
+                    int(item['capacity']),
+                    item['node1_pub'],
+                    item['node2_pub'],
+                    _policy_fields(node_1_policy),
+                    _policy_fields(node_2_policy),
+                ))
+
+    return node_pubkey_index, edges, skipped
+
+def _policy_fields(policy):
+    return (
+        int(policy['min_htlc']),
+        int(policy['max_htlc_msat']),
+        int(policy['time_lock_delta']),
+        int(policy['fee_base_msat']),
+        int(policy['fee_rate_milli_msat']),
+    )
+
+def _sim_node(pubkey, alias, max_htlc_count, capacity_msat, policy):
+    min_htlc, max_htlc_msat, time_lock_delta, fee_base_msat, fee_rate_milli_msat = policy
+    return {
+        "pubkey": pubkey,
+        "alias": alias,
+        "max_htlc_count": max_htlc_count,
+        "max_in_flight_msat": capacity_msat,
+        "min_htlc_size_msat": min_htlc,
+        "max_htlc_size_msat": max_htlc_msat,
+        "cltv_expiry_delta": time_lock_delta,
+        "base_fee": fee_base_msat,
+        "fee_rate_prop": fee_rate_milli_msat
+    }
+
+def convert_to_sim_network(input_file, output_file):
+    node_pubkey_index, edges, skipped = read_graph(input_file)
 
     scid_block = 300
    
     # Sort edges by channel_id to mimic the output of LND's describegraph.
-    sorted_edges = sorted(data["edges"], key=lambda chan: int(chan['channel_id']))
+    edges.sort(key=lambda edge: edge[0])
 
-    for index, edge in enumerate(sorted_edges):
-        node_1_policy = edge.get('node1_policy', None)
-        node_2_policy = edge.get('node2_policy', None)
+    if skipped:
+        print(f"Warning: Skipped {len(skipped)} edges because node1 or node2 policy is null (channel IDs: "
+              f"{', '.join(str(channel_id) for channel_id in sorted(skipped)[:10])}{', ...' if len(skipped) > 10 else ''}).")
 
-        if not node_1_policy or not node_2_policy:
-            print(f"Warning: Skipping edge with channel ID {edge['channel_id']} because node1 or node2 policy is null.")
-            continue
+    # Entries are written as they're converted, producing the same output as json.dump(indent=2) of the full
+    # {"sim_network": [...]} object.
+    with open(output_file, 'w') as f:
+        f.write('{\n  "sim_network": [')
 
-        # Capacity is expressed in sats.
-        capacity_msat = int(edge['capacity']) * 1000
-
-        # Calculate short channel ID, based on warnet indexing
-        scid_tx_index = 1
-        scid_output_index = 0
-
-        scid = (scid_block << 40) | (scid_tx_index << 16) | scid_output_index
-
-        node_1_pubkey = edge['node1_pub']
-        node_2_pubkey = edge['node2_pub']
-
-        node_1_alias = str(node_pubkey_index.get(node_1_pubkey))
-        node_2_alias = str(node_pubkey_index.get(node_2_pubkey))
-
-        node_1 = {
-            "pubkey": node_1_pubkey,
-            "alias": node_1_alias,
-            "max_htlc_count": 483,
-            "max_in_flight_msat": capacity_msat,
-            "min_htlc_size_msat": int(node_1_policy['min_htlc']),
-            "max_htlc_size_msat": int(node_1_policy['max_htlc_msat']),
-            "cltv_expiry_delta": int(node_1_policy['time_lock_delta']),
-            "base_fee": int(node_1_policy['fee_base_msat']),
-            "fee_rate_prop": int(node_1_policy['fee_rate_milli_msat'])
-        }
-
-        node_2 = {
-            "pubkey": node_2_pubkey,
-            "alias": node_2_alias,
-            "max_htlc_count": 15,
-            "max_in_flight_msat": capacity_msat,
-            "min_htlc_size_msat": int(node_2_policy['min_htlc']),
-            "max_htlc_size_msat": int(node_2_policy['max_htlc_msat']),
-            "cltv_expiry_delta": int(node_2_policy['time_lock_delta']),
-            "base_fee": int(node_2_policy['fee_base_msat']),
-            "fee_rate_prop": int(node_2_policy['fee_rate_milli_msat'])
-        }
-
-        sim_network.append({
-            "scid": scid,
-            "capacity_msat": capacity_msat,
-            "node_1": node_1,
-            "node_2": node_2
-        })
-
-        # Add one to scid block height, as we create one channel per block.
-        scid_block += 1
-
-    output_data = {"sim_network": sim_network}
+        for index, (channel_id, capacity, node_1_pubkey, node_2_pubkey, node_1_policy, node_2_policy) in enumerate(edges):
+            # Capacity is expressed in sats.
+            capacity_msat = capacity * 1000
 
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
+            # Calculate short channel ID, based on warnet indexing
+            scid_tx_index = 1
+            scid_output_index = 0
+
+            scid = (scid_block << 40) | (scid_tx_index << 16) | scid_output_index
+
+            node_1_alias = str(node_pubkey_index.get(node_1_pubkey))
+            node_2_alias = str(node_pubkey_index.get(node_2_pubkey))
+
+            entry = {
+                "scid": scid,
+                "capacity_msat": capacity_msat,
+                "node_1": _sim_node(node_1_pubkey, node_1_alias, 483, capacity_msat, node_1_policy),
+                "node_2": _sim_node(node_2_pubkey, node_2_alias, 15, capacity_msat, node_2_policy),
+            }
+
+            f.write((',\n    ' if index else '\n    ') + _dumps_indented(entry).replace('\n', '\n    '))
+
+            # Add one to scid block height, as we create one channel per block.
+            scid_block += 1
+
+        f.write('\n  ]\n}' if edges else ']\n}')
+
+    return len(edges), len(skipped)
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
@@ -1,61 +1,64 @@
+import csv
 import sys
 import time
+import numpy as np
+import pandas as pd
 from datetime import datetime
 from pathlib import Path
 
-def progress_timestamps(csv_file: Path, outfile: Path):
-    with open(csv_file, 'r') as f:
-        headers = next(f).strip().split(',')  # Read and skip the headers
+# Indices of timestamp fields
+TIMESTAMP_INDICES = [2, 3, 6, 7]
 
-        # Read the rest of the lines and process them
-        csv_data = [line.strip().split(',') for line in f]
-    
+def read_chunks(csv_file: Path, chunk_size, columns=None, dtype=str):
+    # Reads the CSV in chunks of rows. Rows are read as strings by default, so that fields we don't touch are
+    # written back exactly as they were read.
+    return pd.read_csv(csv_file, dtype=dtype, usecols=columns, chunksize=chunk_size, keep_default_na=False,
+                       quoting=csv.QUOTE_NONE)
+
+def progress_timestamps(csv_file: Path, outfile: Path, chunk_size=1000000):
     # Find the difference between the current time and the latest timestamp in the CSV and progress timestamps by that amount.
-    time_difference = get_time_difference(csv_data)
-    progress_timestamps_helper(csv_data, time_difference)
+    current_time_ns = int(time.time() * 1e9)
+    time_difference = get_time_difference(csv_file, current_time_ns, chunk_size)
+
+    # Stream updated CSV data to the output a chunk at a time.
+    with open(outfile, 'w') as f:
+        with open(csv_file, 'r') as original:
+            f.write(next(original).strip() + '\n')  # Write headers
+
+        for chunk in read_chunks(csv_file, chunk_size):
+            progress_timestamps_helper(chunk, time_difference, current_time_ns)
+            chunk.to_csv(f, header=False, index=False, quoting=csv.QUOTE_NONE, lineterminator='\n')
 
-    # Write updated CSV data
-    write_csv_data(headers, csv_data, outfile)
     print("CSV data updated and written to", outfile)
 
-def find_latest_timestamp(csv_data):
+def find_latest_timestamp(csv_file: Path, chunk_size=1000000):
     latest_timestamp = None
-    timestamp_indices = [2, 3, 6, 7]  # Indices of timestamp fields
-    for line in csv_data:
-        for index in timestamp_indices:
-            timestamp = int(line[index])
-            if latest_timestamp is None or timestamp > latest_timestamp:
-                latest_timestamp = timestamp
-    return latest_timestamp
+    for chunk in read_chunks(csv_file, chunk_size, TIMESTAMP_INDICES, np.int64):
+        if chunk.empty:
+            continue
 
-def progress_timestamps_helper(csv_data, time_difference):
-    timestamp_indices = [2, 3, 6, 7]  # Indices of timestamp fields
-    current_time_ns = int(time.time() * 1e9)
+        timestamp = int(chunk.to_numpy().max())
+        if latest_timestamp is None or timestamp > latest_timestamp:
+            latest_timestamp = timestamp
+    return latest_timestamp
 
-    for line in csv_data:
-        for index in timestamp_indices:
-            timestamp = int(line[index])
-            updated_timestamp = timestamp + time_difference
-            updated_timestamp = max(updated_timestamp, current_time_ns)
-            line[index] = str(updated_timestamp)
+def progress_timestamps_helper(chunk, time_difference, current_time_ns):
+    for index in TIMESTAMP_INDICES:
+        column = chunk.columns[index]
+        updated_timestamps = chunk[column].to_numpy(dtype=np.int64) + time_difference
+        updated_timestamps = np.maximum(updated_timestamps, current_time_ns)
+        chunk[column] = updated_timestamps.astype(str)
 
-def get_time_difference(csv_data):
-    latest_timestamp = find_latest_timestamp(csv_data)
+def get_time_difference(csv_file: Path, current_time_ns, chunk_size=1000000):
+    latest_timestamp = find_latest_timestamp(csv_file, chunk_size)
     if latest_timestamp is None:
         print("No timestamps found in CSV file.")
         exit(1)
 
     # Calculate time difference
-    current_time_ns = int(time.time() * 1e9)
     time_difference = current_time_ns - latest_timestamp
     return time_difference
 
-def write_csv_data(headers, csv_data, outfile):
-    with open(outfile, 'w') as f:
-        f.write(','.join(headers) + '\n')  # Write headers
-        for line in csv_data:
-            f.write(','.join(line) + '\n')
-
 if __name__ == "__main__":
     if len(sys.argv) < 2 or len(sys.argv) > 3:
         print("Usage: python program.py <csv_file> [<output_file>]")